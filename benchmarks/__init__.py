@@ -0,0 +1 @@
+"""Бенчмарки парсинга, экспорта и обработчиков бота на синтетических счетах (без сети)."""
@@ -0,0 +1,98 @@
+"""
+Минимальные заменители Update/Context из python-telegram-bot для запуска обработчиков офлайн.
+Реализованы только те методы, которые вызывают обработчики бота.
+"""
+import itertools
+
+_message_ids = itertools.count(1)
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+
+class FakeFile:
+    def __init__(self, content: bytes):
+        self._content = content
+
+    async def download_as_bytearray(self):
+        return bytearray(self._content)
+
+class FakeDocument:
+    def __init__(self, content: bytes, file_name: str, mime_type: str = None):
+        self._content = content
+        self.file_name = file_name
+        self.mime_type = mime_type
+        self.file_id = f"fake-{next(_message_ids)}"
+
+    async def get_file(self):
+        return FakeFile(self._content)
+
+class FakeMessage:
+    def __init__(self, chat_id: int, text: str = None, document: FakeDocument = None, media_group_id: str = None):
+        self.chat_id = chat_id
+        self.message_id = next(_message_ids)
+        self.text = text
+        self.document = document
+        self.media_group_id = media_group_id
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        reply = FakeMessage(self.chat_id, text=text)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text, **kwargs):
+        self.text = text
+        return self
+
+class FakeCallbackQuery:
+    def __init__(self, user_id: int, data: str):
+        self.from_user = FakeUser(user_id)
+        self.data = data
+        self.message = FakeMessage(user_id)
+
+    async def answer(self, *args, **kwargs):
+        return True
+
+    async def edit_message_text(self, text, **kwargs):
+        self.message.text = text
+        return self.message
+
+class FakeUpdate:
+    def __init__(self, user_id: int, message: FakeMessage = None, callback_query: FakeCallbackQuery = None):
+        self.effective_user = FakeUser(user_id)
+        self.message = message
+        self.callback_query = callback_query
+        self.effective_message = message or callback_query.message
+
+    @classmethod
+    def document(cls, user_id: int, content: bytes, file_name: str):
+        return cls(user_id, message=FakeMessage(user_id, document=FakeDocument(content, file_name)))
+
+    @classmethod
+    def text(cls, user_id: int, text: str):
+        return cls(user_id, message=FakeMessage(user_id, text=text))
+
+    @classmethod
+    def callback(cls, user_id: int, data: str):
+        return cls(user_id, callback_query=FakeCallbackQuery(user_id, data))
+
+class FakeBot:
+    def __init__(self):
+        self.sent_documents = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return FakeMessage(chat_id, text=text)
+
+    async def send_document(self, chat_id, document, filename=None, **kwargs):
+        # Читаем файл целиком, как это сделала бы отправка в Telegram
+        size = len(document.read()) if hasattr(document, 'read') else 0
+        self.sent_documents.append((filename, size))
+        message = FakeMessage(chat_id)
+        message.document = FakeDocument(b'', filename)
+        return message
+
+class FakeContext:
+    def __init__(self, args=None):
+        self.bot = FakeBot()
+        self.args = args or []
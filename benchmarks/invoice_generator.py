@@ -0,0 +1,78 @@
+import io
+import random
+import argparse
+import datetime
+import openpyxl
+
+CITIES = ['Москва', 'Тверь', 'Клин', 'Подольск', 'Химки', 'Коломна', 'Серпухов', 'Дмитров',
+          'Рязань', 'Тула', 'Калуга', 'Владимир', 'Ярославль', 'Обнинск', 'Солнечногорск']
+SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Кузнецов', 'Смирнов', 'Попов', 'Васильев', 'Соколов',
+            'Михайлов', 'Новиков', 'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов',
+            'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров']
+INITIALS = 'АБВГДЕИКЛМНОПРСТ'
+PLATE_LETTERS = 'АВЕКМНОРСТУХ'
+
+def random_plate(rng: random.Random) -> str:
+    return (f"{rng.choice(PLATE_LETTERS)}{rng.randint(100, 999)}"
+            f"{rng.choice(PLATE_LETTERS)}{rng.choice(PLATE_LETTERS)}{rng.choice(['77', '97', '150', '69'])}")
+
+def random_description(rng: random.Random, fleet, month_start: datetime.date) -> str:
+    route = f"{rng.choice(CITIES)} - {rng.choice(CITIES)}"
+    driver = rng.choice(SURNAMES)
+    initials = f"{rng.choice(INITIALS)}.{rng.choice(INITIALS)}."
+    date = month_start + datetime.timedelta(days=rng.randint(0, 27))
+    variant = rng.random()
+    # Несколько вариантов записи, как в реальных счетах перевозчиков
+    if variant < 0.6:
+        return f"{route}, {driver} {initials}, а/м {rng.choice(fleet)} от {date:%d.%m.%y}"
+    if variant < 0.9:
+        return f"{route}, {driver}, гос. номер {rng.choice(fleet)}, рейс от {date:%d.%m.%y}"
+    return f"{route}, {driver} {initials} а/м {rng.choice(fleet)}"
+
+def generate_invoice(rows: int, seed: int = 0, fleet_size: int = 150, month_start: datetime.date = None) -> bytes:
+    """
+    Собирает xlsx-счет со структурой реальных счетов: шапка, таблица с колонками
+    "Товары (работы, услуги)" и "Сумма", строки перевозок и итоговые строки.
+    """
+    rng = random.Random(seed)
+    month_start = month_start or datetime.date(2024, 3, 1)
+    fleet = [random_plate(rng) for _ in range(fleet_size)]
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('TDSheet')
+    ws.append([None, f"Счет на оплату № {rng.randint(1, 999)} от {month_start:%d.%m.%Y} г."])
+    ws.append([])
+    ws.append([None, 'Поставщик:', 'ООО "ТрансЛогистик", ИНН 7700000000'])
+    ws.append([None, 'Покупатель:', 'ООО "Заказчик", ИНН 7711111111'])
+    ws.append([])
+    ws.append(['№', 'Товары (работы, услуги)', 'Кол-во', 'Ед.', 'Цена', 'Сумма'])
+
+    total = 0.0
+    for number in range(1, rows + 1):
+        amount = rng.choice([4500, 6000, 7500, 9000, 12000, 15000, 18500]) + rng.choice([0, 250, 500])
+        total += amount
+        # Часть сумм — строками с пробелами и запятой, как при выгрузке из 1С
+        amount_cell = f"{amount:,.2f}".replace(',', ' ').replace('.', ',') if rng.random() < 0.3 else float(amount)
+        ws.append([number, random_description(rng, fleet, month_start), 1, 'рейс', amount, amount_cell])
+
+    ws.append([])
+    ws.append([None, None, None, None, 'Итого:', total])
+    ws.append([None, None, None, None, 'В том числе НДС:', round(total * 20 / 120, 2)])
+    ws.append([None, f"Всего наименований {rows}, на сумму {total:,.2f} руб."])
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Генератор синтетических счетов для бенчмарков")
+    parser.add_argument('output', help="Путь к создаваемому .xlsx")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fleet', type=int, default=150, help="Число машин в парке")
+    args = parser.parse_args()
+    with open(args.output, 'wb') as f:
+        f.write(generate_invoice(args.rows, args.seed, args.fleet))
+
+if __name__ == '__main__':
+    main()
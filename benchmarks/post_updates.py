@@ -0,0 +1,47 @@
+"""
+Отправка записанных апдейтов Telegram на вебхук локально запущенного бота.
+
+Запуск из корня репозитория (бот запущен с BOT_MODE=webhook):
+    python -m benchmarks.post_updates updates.json --url http://localhost:8080/telegram
+
+Файл — один апдейт в JSON, список апдейтов или JSON Lines (по апдейту в строке).
+"""
+import sys
+import json
+import time
+import argparse
+import urllib.request
+
+def load_updates(path: str):
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+def post_update(url: str, update: dict, secret: str = None) -> int:
+    headers = {'Content-Type': 'application/json'}
+    if secret:
+        headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+    request = urllib.request.Request(url, data=json.dumps(update).encode('utf-8'), headers=headers, method='POST')
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Отправка записанных апдейтов на вебхук бота")
+    arg_parser.add_argument('path', help="JSON-файл с апдейтами")
+    arg_parser.add_argument('--url', default='http://localhost:8080/telegram', help="Адрес вебхука")
+    arg_parser.add_argument('--secret', help="Значение WEBHOOK_SECRET бота")
+    arg_parser.add_argument('--delay', type=float, default=0, help="Пауза между апдейтами, с")
+    args = arg_parser.parse_args()
+
+    for update in load_updates(args.path):
+        start = time.perf_counter()
+        status = post_update(args.url, update, args.secret)
+        print(f"update_id={update.get('update_id')}: HTTP {status}, {(time.perf_counter() - start) * 1000:.1f} мс")
+        time.sleep(args.delay)
+
+if __name__ == '__main__':
+    sys.exit(main())
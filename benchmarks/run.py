@@ -0,0 +1,145 @@
+"""
+Бенчмарк парсинга, извлечения полей, экспорта и обработчиков бота.
+
+Запуск из корня репозитория:
+    python -m benchmarks.run --sizes 1000,20000,50000
+
+Все работает офлайн: счета генерируются, а обработчики вызываются
+с поддельными Update/Context из benchmarks.fakes.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+
+# Окружение бота настраивается до его импорта: без диска, без процессов, отчеты во временной папке
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('PARSE_EXECUTOR', 'thread')
+os.environ.setdefault('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'transport-bot-bench'))
+os.environ.setdefault('TELEGRAM_TOKEN', 'bench')
+
+import pandas as pd
+import parser
+import periods
+import report
+import bot
+from session import UserSession
+from benchmarks.fakes import FakeUpdate, FakeContext
+from benchmarks.invoice_generator import generate_invoice
+
+def measure(func, *args):
+    """Время одного вызова и пик памяти Python-аллокаций (отдельным прогоном под tracemalloc)"""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+async def measure_async(coro_factory, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro_factory()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def format_row(name: str, rows, elapsed: float, peak: int = None) -> str:
+    rate = f"{rows / elapsed:>12,.0f}" if rows and elapsed else f"{'':>12}"
+    memory = f"{peak / 2 ** 20:>9.1f}" if peak is not None else f"{'':>9}"
+    return f"{name:<40}{rows or '':>9}{elapsed * 1000:>11.1f}{rate}{memory}"
+
+def bench_parsing(size: int, lines):
+    content = generate_invoice(size, seed=size)
+    df, elapsed, peak = measure(parser.process_excel_file, content, f"bench_{size}.xlsx")
+    lines.append(format_row("process_excel_file", len(df), elapsed, peak))
+
+    descriptions = pd.Series(df['Маршрут'].astype(str) + ', ' + df['Водитель'].astype(str)
+                             + ' А.Б., а/м ' + df['Гос_номер'].astype(str) + ' от ' + df['Дата'].dt.strftime(parser.DATE_FORMAT).fillna('—'),
+                             dtype=object)
+    amounts = pd.Series(df['Стоимость'].tolist(), dtype=object)
+    _, elapsed, peak = measure(lambda: [parser.extract_data_from_description(d) for d in descriptions])
+    lines.append(format_row("extract_data_from_description (цикл)", len(descriptions), elapsed, peak))
+    _, elapsed, peak = measure(parser.extract_data_batch, descriptions, amounts)
+    lines.append(format_row("extract_data_batch", len(descriptions), elapsed, peak))
+    return content, df
+
+def bench_export(df: pd.DataFrame, lines):
+    compact = UserSession()
+    compact.append(df, 'bench', 'bench.xlsx')
+    with tempfile.TemporaryDirectory() as directory:
+        for fmt in report.REPORT_FORMATS:
+            path = os.path.join(directory, f"report.{fmt}")
+            _, elapsed, peak = measure(report.build_report, compact.df, fmt, path)
+            lines.append(format_row(f"build_report ({fmt})", len(df), elapsed, peak))
+
+async def bench_handlers(size: int, content: bytes, repeat: int, lines):
+    user_id = size
+    context = FakeContext()
+
+    timings = await measure_async(
+        lambda: bot.handle_document(FakeUpdate.document(user_id, content, f"bench_{size}.xlsx"), context), 1)
+    lines.append(format_row("handle_document (первая загрузка)", size, timings[0]))
+    # Повтор того же файла под другим именем — дубликат по содержимому
+    timings = await measure_async(
+        lambda: bot.handle_document(FakeUpdate.document(user_id, content, f"copy_{size}.xlsx"), context), repeat)
+    lines.append(format_row("handle_document (дубликат)", size, statistics.median(timings)))
+
+    session = await bot.session_store.get(user_id)
+    plate = session.aggregates.top('Гос_номер', 1).index[0]
+    driver = session.aggregates.top('Водитель', 1).index[0]
+
+    month = periods.month_title(session.aggregates.rollups.months()[0])
+    callbacks = ['main_stats', 'main_top', 'summary_car', 'summary_car:1', 'summary_driver',
+                 'main_period_menu', f'period:{month}']
+    for command in callbacks:
+        timings = await measure_async(lambda: bot.button_handler(FakeUpdate.callback(user_id, command), context), repeat)
+        lines.append(format_row(f"button_handler {command}", None, statistics.median(timings)))
+
+    timings = await measure_async(lambda: bot.button_handler(FakeUpdate.callback(user_id, 'export_full'), context), 1)
+    lines.append(format_row("button_handler export_full (сборка)", session.row_count, timings[0]))
+    timings = await measure_async(lambda: bot.button_handler(FakeUpdate.callback(user_id, 'export_full'), context), repeat)
+    lines.append(format_row("button_handler export_full (кэш)", session.row_count, statistics.median(timings)))
+
+    inputs = [
+        ("handle_car_stats_input", bot.handle_car_stats_input, plate),
+        ("handle_driver_stats_input", bot.handle_driver_stats_input, driver),
+        ("handle_driver_stats_input (опечатка)", bot.handle_driver_stats_input, driver[:-1] + 'ъ'),
+        ("handle_car_export_input", bot.handle_car_export_input, plate),
+        ("handle_period_input", bot.handle_period_input, month),
+    ]
+    for name, handler, text in inputs:
+        timings = await measure_async(lambda: handler(FakeUpdate.text(user_id, text), context), repeat)
+        lines.append(format_row(name, None, statistics.median(timings)))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Бенчмарк бота на синтетических счетах")
+    arg_parser.add_argument('--sizes', default='1000,20000', help="Размеры счетов в строках через запятую")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="Повторов для замеров обработчиков")
+    arg_parser.add_argument('--output', help="Дополнительно записать результаты в файл")
+    args = arg_parser.parse_args()
+
+    bot.init_services()
+    lines = [f"{'Замер':<40}{'Строк':>9}{'мс':>11}{'строк/с':>12}{'Пик, МБ':>9}"]
+    for size in (int(s) for s in args.sizes.split(',')):
+        lines.append(f"\n--- Счет на {size} строк ---")
+        content, df = bench_parsing(size, lines)
+        bench_export(df, lines)
+        asyncio.run(bench_handlers(size, content, args.repeat, lines))
+    bot.worker_pool.shutdown()
+
+    output = "\n".join(lines)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + "\n")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,14 @@
 # bot.py (ФИНАЛЬНАЯ ПРОФЕССИОНАЛЬНАЯ ВЕРСИЯ 4.0)
 
+import startup
+if __name__ == '__main__':
+    # Порт проверки здоровья поднимается до тяжелых импортов (pandas, telegram),
+    # чтобы проверка платформы проходила, пока бот еще загружается
+    startup.start_health_server()
+
 import os
 import logging
 import pandas as pd
-import io
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     ApplicationBuilder,
@@ -15,23 +20,63 @@ from telegram.ext import (
     ConversationHandler
 )
 from telegram.error import BadRequest
-import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from parser import process_excel_file
+from telegram.helpers import escape_markdown
+import time
+import asyncio
+import zipfile
+import datetime
+from cache import ParseCache, content_hash, MISS
+from report import ReportCache, REPORT_FORMATS
+from storage import SessionStore, create_backend
+from bulk import BatchReport, MediaGroupCollector, ZipTooLargeError, extract_excel_files, is_zip_document
+from workers import WorkerPool, PoolBusyError, UserBusyError
+from periods import parse_period, month_title
+from webhook import BOT_MODE, ChatOrderedUpdateProcessor, run_webhook
+from outgoing import OutgoingScheduler
+from metrics import registry, track_handler, KNOWN_COMMANDS, DOWNLOAD_SECONDS, DOWNLOAD_BYTES, HANDLER_SECONDS, ROWS_PARSED, PARSE_FAILURES
+
+startup.mark('imports')
 
 # --- Настройка ---
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Хранилище сессий, кэши и пул создаются в init_services при запуске бота, а не при импорте:
+# воркеры парсинга (spawn) заново импортируют этот модуль и не должны открывать
+# базу сессий, поднимать свой пул или регистрировать метрики
+session_store = None
+parse_cache = None
+report_cache = None
+worker_pool = None
+
+def init_services():
+    global session_store, parse_cache, report_cache, worker_pool
+    # Сессии пользователей: строки, загруженные файлы и накопительные итоги.
+    # Горячие сессии держатся в памяти, остальные подгружаются из хранилища (SESSION_BACKEND)
+    session_store = SessionStore(create_backend())
 
-# ИЗМЕНЕНИЕ: Структура для хранения данных стала сложнее, чтобы поддерживать проверку дубликатов
-# user_data = { user_id: {'df': DataFrame, 'processed_files': {'file1.xlsx', 'file2.xlsx'}} }
-user_data = {}
+    # Общий для всех пользователей кэш результатов парсинга по хэшу содержимого
+    parse_cache = ParseCache()
+
+    # Готовые отчеты по версии данных сессии
+    report_cache = ReportCache()
+
+    # Пул воркеров для парсинга и экспорта: тяжелая работа не блокирует event loop
+    worker_pool = WorkerPool()
+
+    # Состояние бота для /metrics: считается в момент запроса
+    registry.gauge('bot_sessions_active', "Сессии пользователей в памяти", lambda: len(session_store))
+    registry.gauge('bot_sessions_memory_bytes', "Объем данных всех сессий в памяти", session_store.memory_usage)
+    registry.gauge('bot_session_memory_max_bytes', "Объем самой большой сессии в памяти", session_store.max_session_memory)
+    registry.gauge('bot_worker_queue_depth', "Задачи в пуле воркеров (выполняются и ждут)", lambda: worker_pool.queued_jobs)
 
 # --- Состояния для диалогов ---
 (
     ASK_CAR_STATS, ASK_DRIVER_STATS,
-    ASK_CAR_EXPORT, ASK_DRIVER_EXPORT
-) = range(4)
+    ASK_CAR_EXPORT, ASK_DRIVER_EXPORT,
+    ASK_PERIOD
+) = range(5)
 
 # --- Клавиатуры ---
 def get_main_menu_keyboard():
@@ -39,14 +84,22 @@ def get_main_menu_keyboard():
         [InlineKeyboardButton("📊 Общая статистика", callback_data='main_stats')],
         [InlineKeyboardButton("🚗 Статистика по гос. номеру", callback_data='main_ask_car_stats')],
         [InlineKeyboardButton("👤 Статистика по фамилии", callback_data='main_ask_driver_stats')],
-        [InlineKeyboardButton("📥 Экспорт в Excel", callback_data='main_export_menu')],
+        [InlineKeyboardButton("📅 Статистика за период", callback_data='main_period_menu')],
+        [InlineKeyboardButton("📥 Экспорт отчетов", callback_data='main_export_menu')],
         [InlineKeyboardButton("🏆 Топ-5", callback_data='main_top')],
         [InlineKeyboardButton("🗑️ Очистить данные", callback_data='main_clear')],
     ])
 
+# Форматы полного отчета: callback_data -> формат файла
+EXPORT_COMMAND_FORMATS = {'export_full': 'xlsx', 'export_full_csv': 'csv', 'export_full_parquet': 'parquet'}
+
 def get_export_menu_keyboard():
+    format_buttons = [InlineKeyboardButton("📄 CSV", callback_data='export_full_csv')]
+    if 'parquet' in REPORT_FORMATS:
+        format_buttons.append(InlineKeyboardButton("📄 Parquet", callback_data='export_full_parquet'))
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("📄 Полный отчет", callback_data='export_full')],
+        [InlineKeyboardButton("📄 Полный отчет (Excel)", callback_data='export_full')],
+        format_buttons,
         [InlineKeyboardButton("🚗 По гос. номеру", callback_data='export_ask_car')],
         [InlineKeyboardButton("👤 По фамилии", callback_data='export_ask_driver')],
         [InlineKeyboardButton("⬅️ Назад в главное меню", callback_data='back_to_main_menu')],
@@ -58,13 +111,65 @@ post_upload_keyboard = InlineKeyboardMarkup([
     [InlineKeyboardButton("⬅️ В главное меню", callback_data='back_to_main_menu')]
 ])
 
+# Сколько месяцев с данными предлагать кнопками в меню периодов
+PERIOD_MENU_MONTHS = 6
+
+def get_period_menu_keyboard(rollups):
+    # Текст кнопки после 'period:' разбирается так же, как ввод пользователя
+    month_buttons = [InlineKeyboardButton(f"🗓 {month_title(month).capitalize()}", callback_data=f'period:{month_title(month)}')
+                     for month in rollups.months()[:PERIOD_MENU_MONTHS]]
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Эта неделя", callback_data='period:эта неделя'),
+         InlineKeyboardButton("Прошлая неделя", callback_data='period:прошлая неделя')],
+        [InlineKeyboardButton("Этот месяц", callback_data='period:этот месяц'),
+         InlineKeyboardButton("Прошлый месяц", callback_data='period:прошлый месяц')],
+        *[month_buttons[i:i + 2] for i in range(0, len(month_buttons), 2)],
+        [InlineKeyboardButton("✏️ Свой период", callback_data='main_ask_period')],
+        [InlineKeyboardButton("⬅️ Назад в главное меню", callback_data='back_to_main_menu')],
+    ])
+
+# Сколько файлов показывать в общей статистике
+STATS_MAX_FILES = 10
+
+def files_stats_text(aggregates) -> str:
+    """Итоги по каждому загруженному файлу, самые крупные сначала"""
+    ranking = aggregates.ranking('Источник')
+    counts = aggregates.counts['Источник']
+    lines = [f"▫️ {escape_markdown(str(name))}: {total:,.0f} руб. ({counts[name]} маршр.)\n"
+             for name, total in ranking.head(STATS_MAX_FILES).items()]
+    if len(ranking) > STATS_MAX_FILES:
+        lines.append(f"... и еще {len(ranking) - STATS_MAX_FILES} файлов\n")
+    return "".join(lines)
+
+# Сколько строк сводки по машинам/водителям показывать на одной странице
+SUMMARY_PAGE_SIZE = 50
+
+def summary_page_keyboard(view: str, page: int, pages: int):
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Назад", callback_data=f'{view}:{page - 1}'))
+    if page < pages - 1:
+        navigation.append(InlineKeyboardButton("Вперед ▶️", callback_data=f'{view}:{page + 1}'))
+    rows = [navigation] if navigation else []
+    rows.append([InlineKeyboardButton("⬅️ В главное меню", callback_data='back_to_main_menu')])
+    return InlineKeyboardMarkup(rows)
+
+# Команды кнопок бота: только они попадают в метку command, остальное считается как 'other'
+KNOWN_COMMANDS.update((
+    'back_to_main_menu', 'cancel_conversation', 'main_stats', 'main_top', 'main_clear',
+    'main_export_menu', 'main_period_menu', 'main_ask_car_stats', 'main_ask_driver_stats',
+    'main_ask_period', 'export_full', 'export_full_csv', 'export_full_parquet',
+    'export_ask_car', 'export_ask_driver', 'period', 'summary_car', 'summary_driver',
+    'pick:car_stats', 'pick:driver_stats', 'pick:car_export', 'pick:driver_export',
+))
+
 cancel_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data='cancel_conversation')]])
 back_to_main_menu_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад в главное меню", callback_data='back_to_main_menu')]])
 
 # --- Главное меню и навигация ---
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отправляет главное меню."""
+async def send_main_menu(update: Update):
+    """Отправляет главное меню (без метрик, чтобы нажатие кнопки не считалось дважды)."""
     user_id = update.effective_user.id
     
     # ИЗМЕНЕНИЕ: Добавляем описание и расширенную статистику
@@ -74,13 +179,13 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Просто загрузите один или несколько Excel-файлов, и я соберу для вас всю статистику."
     )
     
-    if user_id in user_data and not user_data[user_id]['df'].empty:
-        df = user_data[user_id]['df']
+    session = await session_store.get(user_id)
+    if not session.is_empty:
         welcome_text += (
             f"\n\n**Текущая сессия:**\n"
-            f"▫️ Загружено файлов: {len(user_data[user_id]['processed_files'])}\n"
-            f"▫️ Всего записей: {len(df)}\n"
-            f"▫️ Общий доход: *{df['Стоимость'].sum():,.0f} руб.*"
+            f"▫️ Загружено файлов: {len(session.processed_files)}\n"
+            f"▫️ Всего записей: {session.row_count}\n"
+            f"▫️ Общий доход: *{session.aggregates.total_amount:,.0f} руб.*"
         )
     
     # Удаляем предыдущее сообщение, если это возможно, чтобы избежать дублирования меню
@@ -88,11 +193,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.callback_query.edit_message_text(welcome_text, reply_markup=get_main_menu_keyboard(), parse_mode='Markdown')
     else:
         await update.message.reply_text(welcome_text, reply_markup=get_main_menu_keyboard(), parse_mode='Markdown')
-        
+
+@track_handler
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отправляет главное меню."""
+    await send_main_menu(update)
     return ConversationHandler.END
 
 # --- Универсальный обработчик кнопок ---
 
+@track_handler
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -100,23 +210,23 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     command = query.data
 
     # Проверяем, есть ли данные в сессии
-    df = user_data.get(user_id, {}).get('df')
-    has_data = df is not None and not df.empty
+    session = await session_store.get(user_id)
+    has_data = not session.is_empty
 
     # Навигация
     if command == 'back_to_main_menu':
-        await start(update, context)
+        await send_main_menu(update)
         return
 
     # Меню экспорта
     if command == 'main_export_menu':
-        await query.edit_message_text("📥 **Экспорт в Excel**\n\nВыберите тип отчета:", reply_markup=get_export_menu_keyboard(), parse_mode='Markdown')
+        await query.edit_message_text("📥 **Экспорт отчетов**\n\nВыберите тип отчета:", reply_markup=get_export_menu_keyboard(), parse_mode='Markdown')
         return
 
     # Простое действие: Очистка данных
     if command == 'main_clear':
-        if user_id in user_data:
-            user_data[user_id] = {'df': pd.DataFrame(), 'processed_files': set()}
+        if has_data:
+            await session_store.clear(user_id)
             await query.edit_message_text("🗑️ Все загруженные данные удалены.", reply_markup=back_to_main_menu_keyboard)
         else:
             await query.edit_message_text("ℹ️ У вас нет данных для очистки.", reply_markup=back_to_main_menu_keyboard)
@@ -128,37 +238,65 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Действия, требующие данных
+    aggregates = session.aggregates
     if command == 'main_stats':
+        memory = session.memory_usage()
         message = (f"📊 *Общая статистика*\n\n"
-                   f"▫️ Обработано файлов: {len(user_data[user_id]['processed_files'])}\n"
-                   f"▫️ Всего маршрутов: {len(df)}\n"
-                   f"▫️ Общий заработок: *{df['Стоимость'].sum():,.2f} руб.*\n"
-                   f"▫️ Уникальных машин: {df['Гос_номер'].nunique()}\n"
-                   f"▫️ Уникальных водителей: {df['Водитель'].nunique()}")
+                   f"▫️ Обработано файлов: {len(session.processed_files)}\n"
+                   f"▫️ Всего маршрутов: {aggregates.row_count}\n"
+                   f"▫️ Общий заработок: *{aggregates.total_amount:,.2f} руб.*\n"
+                   f"▫️ Уникальных машин: {aggregates.distinct('Гос_номер')}\n"
+                   f"▫️ Уникальных водителей: {aggregates.distinct('Водитель')}\n"
+                   f"▫️ Память сессии: {format_size(memory['compact'])} (без сжатия {format_size(memory['raw'])})\n\n"
+                   f"📁 *По файлам:*\n{files_stats_text(aggregates)}")
         await query.edit_message_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
     elif command == 'main_top':
-        top_drivers = df.groupby('Водитель')['Стоимость'].sum().nlargest(5)
-        top_drivers_text = "".join([f"{i}. {d} - {t:,.0f} руб.\n" for i, (d, t) in enumerate(top_drivers.items(), 1)])
-        top_cars = df.groupby('Гос_номер')['Стоимость'].sum().nlargest(5)
-        top_cars_text = "".join([f"{i}. Номер {c} - {t:,.0f} руб.\n" for i, (c, t) in enumerate(top_cars.items(), 1)])
+        top_drivers = aggregates.top('Водитель', 5)
+        driver_counts = aggregates.counts['Водитель']
+        top_drivers_text = "".join([f"{i}. {d} - {t:,.0f} руб. ({driver_counts[d]} маршр.)\n" for i, (d, t) in enumerate(top_drivers.items(), 1)])
+        top_cars = aggregates.top('Гос_номер', 5)
+        car_counts = aggregates.counts['Гос_номер']
+        top_cars_text = "".join([f"{i}. Номер {c} - {t:,.0f} руб. ({car_counts[c]} маршр.)\n" for i, (c, t) in enumerate(top_cars.items(), 1)])
         message = (f"🏆 *Топ-5 по заработку*\n\n"
                    f"👤 *Лучшие водители:*\n{top_drivers_text or 'Нет данных'}\n"
                    f"🚗 *Самые прибыльные машины:*\n{top_cars_text or 'Нет данных'}")
         await query.edit_message_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
-    elif command == 'export_full':
-        await send_excel_report(df, query.message.chat_id, context, "полный_отчет.xlsx")
+    elif command in ('export_full', 'export_full_csv', 'export_full_parquet'):
+        fmt = EXPORT_COMMAND_FORMATS[command]
+        if fmt not in REPORT_FORMATS:
+            fmt = 'xlsx'
+        if not await send_report(session.df, session, user_id, query.message.chat_id, context, "полный_отчет", 'full', fmt):
+            return
         await context.bot.send_message(query.message.chat_id, "Выберите следующее действие:", reply_markup=back_to_main_menu_keyboard)
-    elif command == 'summary_car' or command == 'summary_driver':
-        group_by_col = 'Гос_номер' if command == 'summary_car' else 'Водитель'
-        title = "🚗 Сводка по автомобилям" if command == 'summary_car' else "👤 Сводка по водителям"
-        summary = df.groupby(group_by_col)['Стоимость'].sum().sort_values(ascending=False)
-        summary_text = f"**{title}**\n\n"
+    elif command == 'main_period_menu':
+        await query.edit_message_text(period_menu_text(session), parse_mode='Markdown',
+                                      reply_markup=get_period_menu_keyboard(aggregates.rollups))
+    elif command.startswith('period:'):
+        period = parse_period(command.split(':', 1)[1], datetime.date.today(), aggregates.rollups.last_date)
+        if period is None:
+            # Кнопки бота всегда дают распознаваемый период, но callback_data может прийти и чужая
+            await query.edit_message_text("❌ Не удалось распознать период.",
+                                          reply_markup=get_period_menu_keyboard(aggregates.rollups))
+            return
+        await query.edit_message_text(period_stats_text(session, *period), parse_mode='Markdown',
+                                      reply_markup=back_to_main_menu_keyboard)
+    elif command.split(':')[0] in ('summary_car', 'summary_driver'):
+        # Сводка постраничная: целиком она не влезает в лимит Telegram в 4096 символов
+        view, _, page = command.partition(':')
+        group_by_col = 'Гос_номер' if view == 'summary_car' else 'Водитель'
+        title = "🚗 Сводка по автомобилям" if view == 'summary_car' else "👤 Сводка по водителям"
+        # Номер страницы приходит из callback_data; нечисловой — первая страница
+        page = int(page) if page.isdigit() else 0
+        summary, page, pages = aggregates.ranking_page(group_by_col, page, SUMMARY_PAGE_SIZE)
+        counts = aggregates.counts[group_by_col]
+        summary_text = f"**{title}** (стр. {page + 1} из {pages})\n\n"
         for item, total in summary.items():
-            summary_text += f"▫️ {item}: *{total:,.0f} руб.*\n"
-        await query.edit_message_text(summary_text, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
+            summary_text += f"▫️ {item}: *{total:,.0f} руб.* ({counts[item]} маршр.)\n"
+        await query.edit_message_text(summary_text, parse_mode='Markdown', reply_markup=summary_page_keyboard(view, page, pages))
 
 # --- Логика диалогов (ConversationHandler) ---
 
+@track_handler
 async def ask_for_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -176,131 +314,439 @@ async def ask_for_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == 'export_ask_driver':
         await query.edit_message_text("👤 Введите фамилию для экспорта отчета:", reply_markup=cancel_keyboard)
         return ASK_DRIVER_EXPORT
+    elif action == 'main_ask_period':
+        await query.edit_message_text(f"📅 Введите период:\n{PERIOD_INPUT_HINT}", reply_markup=cancel_keyboard)
+        return ASK_PERIOD
+
+async def read_lookup_input(update: Update) -> str:
+    """Ввод пользователя: текст сообщения или значение, выбранное кнопкой-подсказкой"""
+    if update.callback_query:
+        await update.callback_query.answer()
+        return update.callback_query.data.split(':', 2)[2]
+    return update.message.text
+
+def suggestions_keyboard(pick_prefix: str, candidates):
+    rows = [[InlineKeyboardButton(candidate, callback_data=f'{pick_prefix}:{candidate}')]
+            for candidate in candidates
+            # Telegram ограничивает callback_data 64 байтами
+            if len(f'{pick_prefix}:{candidate}'.encode('utf-8')) <= 64]
+    rows.append([InlineKeyboardButton("❌ Отмена", callback_data='cancel_conversation')])
+    return InlineKeyboardMarkup(rows)
+
+async def reply_not_found(update: Update, session, col: str, user_input: str, pick_prefix: str, text: str):
+    # Вместо повторного ввода предлагаем ближайшие значения кнопками
+    candidates = session.index.suggest(col, user_input)
+    if candidates:
+        text += "\n\nВозможно, вы имели в виду:"
+        await update.effective_message.reply_text(text, reply_markup=suggestions_keyboard(pick_prefix, candidates))
+    else:
+        await update.effective_message.reply_text(text, reply_markup=cancel_keyboard)
 
+@track_handler
 async def handle_car_stats_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_input = update.message.text
+    user_input = await read_lookup_input(update)
     user_id = update.effective_user.id
-    df = user_data.get(user_id, {}).get('df', pd.DataFrame())
-    car_df = df[df['Гос_номер'].astype(str).str.contains(user_input, case=False, na=False)]
+    session = await session_store.get(user_id)
+    matched, car_df = session.lookup('Гос_номер', user_input)
     
     # ИЗМЕНЕНИЕ: Цикл повторного ввода
     if car_df.empty:
-        await update.message.reply_text(f"❌ Машина с номером '{user_input}' не найдена. Попробуйте еще раз или нажмите 'Отмена'.", reply_markup=cancel_keyboard)
+        await reply_not_found(update, session, 'Гос_номер', user_input, 'pick:car_stats',
+                              f"❌ Машина с номером '{user_input}' не найдена. Попробуйте еще раз или нажмите 'Отмена'.")
         return ASK_CAR_STATS # Остаемся в том же состоянии
         
     drivers = ", ".join(car_df['Водитель'].unique())
-    message = (f"🚗 *Статистика по машине {user_input}*\n\n"
+    message = (f"🚗 *Статистика по машине {', '.join(matched)}*\n\n"
                f"▫️ Совершено маршрутов: {len(car_df)}\n"
                f"▫️ Общий заработок: *{car_df['Стоимость'].sum():,.2f} руб.*\n"
                f"▫️ Водители: {drivers}")
-    await update.message.reply_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
+    await update.effective_message.reply_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
     return ConversationHandler.END
 
+@track_handler
 async def handle_driver_stats_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_input = update.message.text
+    user_input = await read_lookup_input(update)
     user_id = update.effective_user.id
-    df = user_data.get(user_id, {}).get('df', pd.DataFrame())
-    driver_df = df[df['Водитель'].str.contains(user_input, case=False, na=False)]
+    session = await session_store.get(user_id)
+    matched, driver_df = session.lookup('Водитель', user_input)
     
     if driver_df.empty:
-        await update.message.reply_text(f"❌ Водитель '{user_input}' не найден. Попробуйте еще раз или нажмите 'Отмена'.", reply_markup=cancel_keyboard)
+        await reply_not_found(update, session, 'Водитель', user_input, 'pick:driver_stats',
+                              f"❌ Водитель '{user_input}' не найден. Попробуйте еще раз или нажмите 'Отмена'.")
         return ASK_DRIVER_STATS # Остаемся в том же состоянии
 
     cars = ", ".join(driver_df['Гос_номер'].unique())
-    message = (f"👤 *Статистика по водителю {user_input}*\n\n"
+    message = (f"👤 *Статистика по водителю {', '.join(matched)}*\n\n"
                f"▫️ Совершено маршрутов: {len(driver_df)}\n"
                f"▫️ Общий заработок: *{driver_df['Стоимость'].sum():,.2f} руб.*\n"
                f"▫️ Машины: {cars}")
-    await update.message.reply_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
+    await update.effective_message.reply_text(message, parse_mode='Markdown', reply_markup=back_to_main_menu_keyboard)
     return ConversationHandler.END
 
+@track_handler
 async def handle_car_export_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_input = update.message.text
+    user_input = await read_lookup_input(update)
     user_id = update.effective_user.id
-    df = user_data.get(user_id, {}).get('df', pd.DataFrame())
-    car_df = df[df['Гос_номер'].astype(str).str.contains(user_input, case=False, na=False)]
+    session = await session_store.get(user_id)
+    matched, car_df = session.lookup('Гос_номер', user_input)
     
     if car_df.empty:
-        await update.message.reply_text(f"❌ Машина '{user_input}' не найдена. Попробуйте еще раз или отмените экспорт.", reply_markup=cancel_keyboard)
+        await reply_not_found(update, session, 'Гос_номер', user_input, 'pick:car_export',
+                              f"❌ Машина '{user_input}' не найдена. Попробуйте еще раз или отмените экспорт.")
         return ASK_CAR_EXPORT # Остаемся в том же состоянии
         
-    await send_excel_report(car_df, update.message.chat_id, context, f"отчет_машина_{user_input}.xlsx")
-    await update.message.reply_text("Выберите следующее действие:", reply_markup=back_to_main_menu_keyboard)
+    chat_id = update.effective_message.chat_id
+    if not await send_report(car_df, session, user_id, chat_id, context, f"отчет_машина_{user_input}", f"car:{','.join(matched)}"):
+        return ConversationHandler.END
+    await update.effective_message.reply_text("Выберите следующее действие:", reply_markup=back_to_main_menu_keyboard)
     return ConversationHandler.END
 
+@track_handler
 async def handle_driver_export_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_input = update.message.text
+    user_input = await read_lookup_input(update)
     user_id = update.effective_user.id
-    df = user_data.get(user_id, {}).get('df', pd.DataFrame())
-    driver_df = df[df['Водитель'].str.contains(user_input, case=False, na=False)]
+    session = await session_store.get(user_id)
+    matched, driver_df = session.lookup('Водитель', user_input)
 
     if driver_df.empty:
-        await update.message.reply_text(f"❌ Водитель '{user_input}' не найден. Попробуйте еще раз или отмените экспорт.", reply_markup=cancel_keyboard)
+        await reply_not_found(update, session, 'Водитель', user_input, 'pick:driver_export',
+                              f"❌ Водитель '{user_input}' не найден. Попробуйте еще раз или отмените экспорт.")
         return ASK_DRIVER_EXPORT # Остаемся в том же состоянии
         
-    await send_excel_report(driver_df, update.message.chat_id, context, f"отчет_водитель_{user_input}.xlsx")
-    await update.message.reply_text("Выберите следующее действие:", reply_markup=back_to_main_menu_keyboard)
+    chat_id = update.effective_message.chat_id
+    if not await send_report(driver_df, session, user_id, chat_id, context, f"отчет_водитель_{user_input}", f"driver:{','.join(matched)}"):
+        return ConversationHandler.END
+    await update.effective_message.reply_text("Выберите следующее действие:", reply_markup=back_to_main_menu_keyboard)
     return ConversationHandler.END
 
-async def send_excel_report(df: pd.DataFrame, chat_id: int, context: ContextTypes.DEFAULT_TYPE, filename: str):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False, sheet_name='Отчет')
-        worksheet = writer.sheets['Отчет']
-        for idx, col in enumerate(df):
-            max_len = max((df[col].astype(str).map(len).max(), len(str(df[col].name)) + 1))
-            worksheet.set_column(idx, idx, max_len)
-    output.seek(0)
-    await context.bot.send_document(chat_id=chat_id, document=output, filename=filename, caption='📊 Ваш отчет готов.')
+# --- Статистика за период (по готовым итогам за дни, недели и месяцы) ---
+
+PERIOD_INPUT_HINT = "например: «эта неделя», «прошлый месяц», «март», «март 2024» или «01.03.24-15.03.24»"
 
+def period_menu_text(session) -> str:
+    rollups = session.aggregates.rollups
+    text = "📅 *Статистика за период*\n\n"
+    if rollups.is_empty:
+        return text + "ℹ️ В загруженных данных нет дат."
+    return text + f"Данные есть с {rollups.first_date:%d.%m.%y} по {rollups.last_date:%d.%m.%y}. Выберите период:"
+
+def period_stats_text(session, start: datetime.date, end: datetime.date, title: str) -> str:
+    rollups = session.aggregates.rollups
+    summary = rollups.summary(start, end)
+    text = f"📅 *Статистика за {title}* ({start:%d.%m.%y} – {end:%d.%m.%y})\n\n"
+    if not summary['count']:
+        text += "ℹ️ За этот период записей нет."
+    else:
+        top_cars = "".join(f"{i}. Номер {c} - {t:,.0f} руб.\n" for i, (c, t) in enumerate(summary['Гос_номер'].head(5).items(), 1))
+        top_drivers = "".join(f"{i}. {d} - {t:,.0f} руб.\n" for i, (d, t) in enumerate(summary['Водитель'].head(5).items(), 1))
+        text += (f"▫️ Совершено маршрутов: {summary['count']}\n"
+                 f"▫️ Общий заработок: *{summary['amount']:,.2f} руб.*\n"
+                 f"▫️ Машин: {len(summary['Гос_номер'])}, водителей: {len(summary['Водитель'])}\n\n"
+                 f"🚗 *Машины:*\n{top_cars}\n"
+                 f"👤 *Водители:*\n{top_drivers}")
+    if rollups.undated_count:
+        text += f"\nℹ️ Записей без даты (не входят в периоды): {rollups.undated_count}"
+    return text
+
+@track_handler
+async def handle_period_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    session = await session_store.get(update.effective_user.id)
+    period = parse_period(update.message.text, datetime.date.today(), session.aggregates.rollups.last_date)
+    if period is None:
+        await update.message.reply_text(f"❌ Не удалось распознать период. Введите, {PERIOD_INPUT_HINT}.",
+                                        reply_markup=cancel_keyboard)
+        return ASK_PERIOD # Остаемся в том же состоянии
+    await update.message.reply_text(period_stats_text(session, *period), parse_mode='Markdown',
+                                    reply_markup=back_to_main_menu_keyboard)
+    return ConversationHandler.END
+
+@track_handler
+async def period_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/period [период]: без аргумента — меню периодов"""
+    session = await session_store.get(update.effective_user.id)
+    if session.is_empty:
+        await update.message.reply_text("ℹ️ Данные для анализа отсутствуют. Загрузите файлы.")
+        return
+    rollups = session.aggregates.rollups
+    if not context.args:
+        await update.message.reply_text(period_menu_text(session), parse_mode='Markdown',
+                                        reply_markup=get_period_menu_keyboard(rollups))
+        return
+    period = parse_period(" ".join(context.args), datetime.date.today(), rollups.last_date)
+    if period is None:
+        await update.message.reply_text(f"❌ Не удалось распознать период. Укажите, {PERIOD_INPUT_HINT}.")
+        return
+    await update.message.reply_text(period_stats_text(session, *period), parse_mode='Markdown',
+                                    reply_markup=back_to_main_menu_keyboard)
+
+def format_size(num_bytes: int) -> str:
+    if num_bytes < 1024:
+        return f"{num_bytes} Б"
+    for unit in ('КБ', 'МБ'):
+        num_bytes /= 1024
+        if num_bytes < 1024:
+            return f"{num_bytes:,.1f} {unit}"
+    return f"{num_bytes / 1024:,.1f} ГБ"
+
+async def download_document(document) -> bytes:
+    with DOWNLOAD_SECONDS.time():
+        file = await document.get_file()
+        content = bytes(await file.download_as_bytearray())
+    DOWNLOAD_BYTES.inc(amount=len(content))
+    return content
+
+def count_parse_result(result):
+    """Учет свежего (не из кэша) результата парсинга в метриках"""
+    if isinstance(result, Exception):
+        PARSE_FAILURES.inc('error')
+    elif result is None or result.empty:
+        PARSE_FAILURES.inc('empty')
+    else:
+        ROWS_PARSED.inc(amount=len(result))
+
+def busy_message(error: Exception) -> str:
+    if isinstance(error, UserBusyError):
+        return "⏳ Предыдущие задачи еще выполняются. Дождитесь их завершения и повторите."
+    return "⏳ Бот сейчас загружен. Попробуйте повторить через минуту."
+
+async def send_report(df: pd.DataFrame, session, user_id: int, chat_id: int, context: ContextTypes.DEFAULT_TYPE,
+                      filename: str, scope: str, fmt: str = 'xlsx') -> bool:
+    """
+    Отправляет отчет в нужном формате. Отчет по той же версии данных и тем же условиям
+    берется из кэша: уже отправленный — по file_id Telegram, иначе — готовый файл с диска.
+    """
+    key = (user_id, session.data_version, scope, fmt)
+    cached = report_cache.get(key)
+    if cached is None:
+        path = report_cache.path_for(user_id, session.data_version, scope, fmt)
+        try:
+            await worker_pool.export(user_id, df, fmt, path)
+        except (PoolBusyError, UserBusyError) as e:
+            await context.bot.send_message(chat_id, busy_message(e), reply_markup=back_to_main_menu_keyboard)
+            return False
+        except Exception:
+            # Воркер мог упасть (например, по памяти) — пользователь все равно получает ответ
+            logger.exception("Не удалось сформировать отчет %s", path)
+            await context.bot.send_message(chat_id, "❌ Не удалось сформировать отчет. Попробуйте позже.",
+                                           reply_markup=back_to_main_menu_keyboard)
+            return False
+        report_cache.put(key, path)
+        cached = report_cache.get(key)
+
+    if cached['file_id']:
+        message = await context.bot.send_document(chat_id=chat_id, document=cached['file_id'],
+                                                  filename=f"{filename}.{fmt}", caption='📊 Ваш отчет готов.')
+    else:
+        with open(cached['path'], 'rb') as document:
+            message = await context.bot.send_document(chat_id=chat_id, document=document,
+                                                      filename=f"{filename}.{fmt}", caption='📊 Ваш отчет готов.')
+    report_cache.set_file_id(key, message.document.file_id)
+    return True
+
+@track_handler
 async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     await query.edit_message_text("Действие отменено.", reply_markup=back_to_main_menu_keyboard)
     return ConversationHandler.END
 
+def cached_parse_result(file_hash: str, file_name: str):
+    """Результат из общего кэша парсинга с колонкой 'Источник' под имя этой загрузки (или MISS)"""
+    new_df = parse_cache.get(file_hash)
+    if new_df is not MISS and new_df is not None:
+        new_df = new_df.assign(Источник=file_name)
+    return new_df
+
+@track_handler
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Документы медиагруппы приходят отдельными апдейтами — собираем их в одну пачку
+    if update.message.media_group_id:
+        media_groups.add(update.message.media_group_id, update)
+        return
+    if is_zip_document(update.message.document.file_name, update.message.document.mime_type):
+        await process_batch(update.effective_user.id, update.message, [update.message.document])
+        return
+
     user_id = update.effective_user.id
-    file = await update.message.document.get_file()
     file_name = update.message.document.file_name
 
     # Инициализируем данные пользователя, если их еще нет
-    if user_id not in user_data:
-        user_data[user_id] = {'df': pd.DataFrame(), 'processed_files': set()}
-    
-    # ИЗМЕНЕНИЕ: Проверка на дубликаты
-    if file_name in user_data[user_id]['processed_files']:
-        await update.message.reply_text(f"⚠️ Файл '{file_name}' уже был загружен ранее. Загрузка пропущена.")
-        return
+    session = await session_store.get(user_id)
 
     await update.message.reply_text(f"⏳ Получил файл '{file_name}'. Обрабатываю...")
-    file_content = await file.download_as_bytearray()
-    new_df = process_excel_file(bytes(file_content), file_name)
+    file_content = await download_document(update.message.document)
+
+    # Дубликаты определяем по содержимому: переименованная копия — тот же файл,
+    # а другой файл с тем же именем — новый
+    file_hash = content_hash(file_content)
+    if file_hash in session.processed_files:
+        await update.message.reply_text(
+            f"⚠️ Файл '{file_name}' уже был загружен ранее (как '{session.processed_files[file_hash]}'). Загрузка пропущена.")
+        return
+
+    # Один и тот же файл часто загружают несколько диспетчеров — берем готовый результат из кэша
+    new_df = cached_parse_result(file_hash, file_name)
+    if new_df is MISS:
+        try:
+            new_df = await worker_pool.parse(user_id, file_content, file_name)
+        except (PoolBusyError, UserBusyError) as e:
+            await update.message.reply_text(busy_message(e))
+            return
+        except Exception as e:
+            logger.exception("Не удалось обработать файл %s", file_name)
+            count_parse_result(e)
+            await update.message.reply_text(f"❌ Ошибка при обработке файла '{file_name}'. Попробуйте загрузить его еще раз.")
+            return
+        parse_cache.put(file_hash, new_df)
+        count_parse_result(new_df)
     
     if new_df is None or new_df.empty:
         await update.message.reply_text(f"⚠️ Не удалось извлечь данные из файла '{file_name}'.")
         return
     
-    user_data[user_id]['df'] = pd.concat([user_data[user_id]['df'], new_df], ignore_index=True)
-    user_data[user_id]['processed_files'].add(file_name)
+    if not await session_store.append(user_id, new_df, file_hash, file_name):
+        await update.message.reply_text(f"⚠️ Файл '{file_name}' уже был загружен ранее. Загрузка пропущена.")
+        return
+    # Пока файл скачивался и парсился, сессию могли вытеснить из памяти — берем актуальную
+    session = await session_store.get(user_id)
     
     message_text = (f"✅ Файл '{file_name}' успешно обработан!\n"
                     f"Добавлено записей: {len(new_df)}\n"
-                    f"Всего загружено: {len(user_data[user_id]['df'])}\n\n"
+                    f"Всего загружено: {session.row_count}\n\n"
                     "Что вы хотите сделать дальше?")
     await update.message.reply_text(message_text, reply_markup=post_upload_keyboard)
 
-class HealthCheckHandler(BaseHTTPRequestHandler):
-    def do_GET(self): self.send_response(200); self.send_header("Content-type", "text/plain"); self.end_headers(); self.wfile.write(b"Bot is alive")
-    def do_HEAD(self): self.send_response(200); self.send_header("Content-type", "text/plain"); self.end_headers()
-    def log_message(self, format, *args): return
-def run_health_check_server():
-    port = int(os.environ.get("PORT", 8080)); httpd = HTTPServer(('', port), HealthCheckHandler); httpd.serve_forever()
+# --- Пакетная загрузка: ZIP-архивы и медиагруппы ---
+
+async def download_batch_files(documents):
+    """Скачивает документы пачки параллельно; ZIP-архивы раскрываются в их Excel-файлы"""
+    contents = await asyncio.gather(*(download_document(doc) for doc in documents), return_exceptions=True)
+    files = []
+    for document, content in zip(documents, contents):
+        if isinstance(content, Exception):
+            files.append((document.file_name, content))
+        elif is_zip_document(document.file_name, document.mime_type):
+            try:
+                files.extend(await asyncio.to_thread(extract_excel_files, content))
+            except (zipfile.BadZipFile, ZipTooLargeError) as e:
+                files.append((document.file_name, e))
+        else:
+            files.append((document.file_name, content))
+    return files
+
+async def process_batch(user_id: int, message, documents):
+    """
+    Обрабатывает пачку документов одним сообщением: файлы парсятся параллельно,
+    результат добавляется в сессию за один шаг, а сообщение о прогрессе
+    в конце заменяется сводкой по каждому файлу.
+    """
+    status_message = await message.reply_text("⏳ Получил файлы. Скачиваю...")
+    files = await download_batch_files(documents)
+    report = BatchReport(len(files))
+    if not files:
+        await status_message.edit_text("⚠️ В загрузке нет Excel-файлов.", reply_markup=back_to_main_menu_keyboard)
+        return
+
+    session = await session_store.get(user_id)
+    hashes = await asyncio.to_thread(
+        lambda: [content_hash(content) if isinstance(content, bytes) else None for _, content in files])
+
+    # results[i] — DataFrame, None (данных нет), исключение или имя ранее загруженного дубликата
+    results = [None] * len(files)
+    duplicates = {}
+    seen = {}
+    to_parse = []
+    for i, ((file_name, content), file_hash) in enumerate(zip(files, hashes)):
+        if isinstance(content, Exception):
+            results[i] = content
+        elif file_hash in session.processed_files:
+            duplicates[i] = session.processed_files[file_hash]
+        elif file_hash in seen:
+            duplicates[i] = files[seen[file_hash]][0]
+        else:
+            seen[file_hash] = i
+            results[i] = cached_parse_result(file_hash, file_name)
+            if results[i] is MISS:
+                to_parse.append(i)
+
+    progress = {'done': len(files) - len(to_parse), 'edited_at': time.monotonic()}
+
+    async def on_parsed(file_name, result):
+        progress['done'] += 1
+        # Не чаще раза в пару секунд, чтобы не упираться в лимиты Telegram на редактирование
+        if time.monotonic() - progress['edited_at'] >= 2:
+            progress['edited_at'] = time.monotonic()
+            try:
+                await status_message.edit_text(report.progress_text(progress['done']))
+            except BadRequest:
+                pass
+
+    if to_parse:
+        try:
+            parsed = await worker_pool.parse_many(
+                user_id, [(files[i][1], files[i][0]) for i in to_parse], on_done=on_parsed)
+        except (PoolBusyError, UserBusyError) as e:
+            await status_message.edit_text(busy_message(e), reply_markup=back_to_main_menu_keyboard)
+            return
+        for i, result in zip(to_parse, parsed):
+            if not isinstance(result, Exception):
+                parse_cache.put(hashes[i], result)
+            count_parse_result(result)
+            results[i] = result
+
+    to_append = [i for i, result in enumerate(results)
+                 if isinstance(result, pd.DataFrame) and not result.empty and i not in duplicates]
+    accepted = await session_store.append_many(
+        user_id, [(results[i], hashes[i], files[i][0]) for i in to_append])
+    for i, ok in zip(to_append, accepted):
+        if not ok:
+            duplicates[i] = files[i][0]
+    session = await session_store.get(user_id)
+
+    for i, (file_name, _) in enumerate(files):
+        result = results[i]
+        if i in duplicates:
+            report.add(file_name, BatchReport.DUPLICATE, duplicates[i])
+        elif isinstance(result, Exception):
+            report.add(file_name, BatchReport.FAILED, str(result) or type(result).__name__)
+        elif result is None or result.empty:
+            report.add(file_name, BatchReport.EMPTY)
+        else:
+            report.add(file_name, BatchReport.ADDED, len(result))
+
+    await status_message.edit_text(report.summary_text(session.row_count), reply_markup=post_upload_keyboard)
+
+async def process_media_group(updates):
+    first = updates[0]
+    # Медиагруппа обрабатывается вне обработчиков апдейтов, поэтому замеряется отдельно
+    with HANDLER_SECONDS.time('process_media_group', ''):
+        await process_batch(first.effective_user.id, first.message, [update.message.document for update in updates])
+
+media_groups = MediaGroupCollector(process_media_group)
+
+async def mark_ready(application):
+    startup.set_ready()
+
+async def shutdown_workers(application):
+    startup.set_ready(False)
+    worker_pool.shutdown()
+    session_store.close()
 
 if __name__ == '__main__':
     TOKEN = os.getenv('TELEGRAM_TOKEN')
     if not TOKEN: raise ValueError("Необходимо установить переменную окружения TELEGRAM_TOKEN")
-    application = ApplicationBuilder().token(TOKEN).build()
+    init_services()
+    # Отчеты прошлого запуска не привязаны ни к одной записи кэша
+    report_cache.reset()
+    # Апдейты разных чатов обрабатываются параллельно, одного чата — по порядку
+    builder = (ApplicationBuilder().token(TOKEN).concurrent_updates(ChatOrderedUpdateProcessor())
+               .post_init(mark_ready).post_shutdown(shutdown_workers))
+    # Все исходящие сообщения идут через общий планировщик с лимитами Telegram
+    builder = builder.rate_limiter(OutgoingScheduler())
+    if BOT_MODE == 'webhook':
+        # Апдейты приходят на HTTP-сервер бота, опрашивать Telegram не нужно
+        builder = builder.updater(None)
+    application = builder.build()
     
     conv_handler = ConversationHandler(
         entry_points=[
@@ -308,12 +754,26 @@ if __name__ == '__main__':
             CallbackQueryHandler(ask_for_input, pattern='^main_ask_driver_stats$'),
             CallbackQueryHandler(ask_for_input, pattern='^export_ask_car$'),
             CallbackQueryHandler(ask_for_input, pattern='^export_ask_driver$'),
+            CallbackQueryHandler(ask_for_input, pattern='^main_ask_period$'),
         ],
         states={
-            ASK_CAR_STATS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_car_stats_input)],
-            ASK_DRIVER_STATS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_driver_stats_input)],
-            ASK_CAR_EXPORT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_car_export_input)],
-            ASK_DRIVER_EXPORT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_driver_export_input)],
+            ASK_CAR_STATS: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_car_stats_input),
+                CallbackQueryHandler(handle_car_stats_input, pattern='^pick:car_stats:'),
+            ],
+            ASK_DRIVER_STATS: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_driver_stats_input),
+                CallbackQueryHandler(handle_driver_stats_input, pattern='^pick:driver_stats:'),
+            ],
+            ASK_CAR_EXPORT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_car_export_input),
+                CallbackQueryHandler(handle_car_export_input, pattern='^pick:car_export:'),
+            ],
+            ASK_DRIVER_EXPORT: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_driver_export_input),
+                CallbackQueryHandler(handle_driver_export_input, pattern='^pick:driver_export:'),
+            ],
+            ASK_PERIOD: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_period_input)],
         },
         fallbacks=[
             CommandHandler('start', start),
@@ -322,11 +782,15 @@ if __name__ == '__main__':
     )
     
     application.add_handler(CommandHandler('start', start))
+    application.add_handler(CommandHandler('period', period_command))
     application.add_handler(conv_handler)
     application.add_handler(CallbackQueryHandler(button_handler))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
     
-    threading.Thread(target=run_health_check_server, daemon=True).start()
-    
+    startup.mark('application')
     print("Бот запущен в финальной профессиональной версии (v4.0)...")
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        # Один asyncio-сервер на PORT: вебхук, проверка здоровья и метрики
+        asyncio.run(run_webhook(application, startup.PORT))
+    else:
+        application.run_polling()
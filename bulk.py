@@ -0,0 +1,114 @@
+import os
+import io
+import asyncio
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Ограничения пакетной загрузки (через переменные окружения) ---
+MAX_ZIP_MEMBERS = int(os.getenv('MAX_ZIP_MEMBERS', 200))
+MAX_ZIP_UNCOMPRESSED_MB = int(os.getenv('MAX_ZIP_UNCOMPRESSED_MB', 200))
+MEDIA_GROUP_DELAY = float(os.getenv('MEDIA_GROUP_DELAY', 1.5))
+# Сколько строк по файлам показывать в итоговом сообщении (лимит Telegram — 4096 символов)
+SUMMARY_MAX_LINES = 40
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+class ZipTooLargeError(Exception):
+    """Архив превышает ограничения по числу файлов или объему"""
+
+def is_zip_document(file_name: str, mime_type: str = None) -> bool:
+    return (file_name or '').lower().endswith('.zip') or mime_type in ('application/zip', 'application/x-zip-compressed')
+
+def extract_excel_files(zip_content: bytes):
+    """
+    Достает Excel-файлы из ZIP-архива и возвращает список (имя, содержимое).
+    Служебные файлы macOS и вложенные папки без Excel пропускаются.
+    """
+    with zipfile.ZipFile(io.BytesIO(zip_content)) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir()
+            and info.filename.lower().endswith(EXCEL_EXTENSIONS)
+            and not info.filename.startswith('__MACOSX/')
+            and not os.path.basename(info.filename).startswith(('~$', '._'))
+        ]
+        # Проверяем заявленный размер до распаковки, чтобы не распаковывать zip-бомбы
+        if len(members) > MAX_ZIP_MEMBERS:
+            raise ZipTooLargeError(f"в архиве больше {MAX_ZIP_MEMBERS} файлов")
+        if sum(info.file_size for info in members) > MAX_ZIP_UNCOMPRESSED_MB * 1024 * 1024:
+            raise ZipTooLargeError(f"распакованный объем больше {MAX_ZIP_UNCOMPRESSED_MB} МБ")
+        return [(os.path.basename(info.filename), archive.read(info)) for info in members]
+
+class MediaGroupCollector:
+    """
+    Собирает документы одной медиагруппы Telegram, которые приходят отдельными апдейтами.
+    Группа передается в callback, когда новые документы перестают приходить в течение delay секунд.
+    """
+
+    def __init__(self, callback, delay: float = MEDIA_GROUP_DELAY):
+        self._callback = callback
+        self._delay = delay
+        self._groups = {}
+        self._timers = {}
+
+    def add(self, media_group_id: str, item):
+        self._groups.setdefault(media_group_id, []).append(item)
+        timer = self._timers.get(media_group_id)
+        if timer:
+            timer.cancel()
+        self._timers[media_group_id] = asyncio.create_task(self._flush_later(media_group_id))
+
+    async def _flush_later(self, media_group_id: str):
+        await asyncio.sleep(self._delay)
+        self._timers.pop(media_group_id, None)
+        items = self._groups.pop(media_group_id, [])
+        try:
+            await self._callback(items)
+        except Exception:
+            logger.exception("Ошибка при обработке медиагруппы %s", media_group_id)
+
+class BatchReport:
+    """Итоги пакетной загрузки по каждому файлу для одного сводного сообщения"""
+
+    ADDED, DUPLICATE, EMPTY, FAILED = 'added', 'duplicate', 'empty', 'failed'
+
+    def __init__(self, total: int):
+        self.total = total
+        self.results = []
+
+    def add(self, file_name: str, status: str, detail=None):
+        self.results.append((file_name, status, detail))
+
+    def count(self, status: str) -> int:
+        return sum(1 for _, s, _ in self.results if s == status)
+
+    @property
+    def rows_added(self) -> int:
+        return sum(detail for _, s, detail in self.results if s == self.ADDED)
+
+    def progress_text(self, done: int) -> str:
+        return f"⏳ Обрабатываю файлы: {done} из {self.total}..."
+
+    def summary_text(self, total_rows: int) -> str:
+        lines = []
+        for file_name, status, detail in self.results[:SUMMARY_MAX_LINES]:
+            if status == self.ADDED:
+                lines.append(f"✅ {file_name}: +{detail} записей")
+            elif status == self.DUPLICATE:
+                lines.append(f"🔁 {file_name}: дубликат '{detail}'")
+            elif status == self.EMPTY:
+                lines.append(f"⚠️ {file_name}: данные не найдены")
+            else:
+                lines.append(f"❌ {file_name}: ошибка ({str(detail)[:80]})")
+        if len(self.results) > SUMMARY_MAX_LINES:
+            lines.append(f"... и еще {len(self.results) - SUMMARY_MAX_LINES} файлов")
+
+        return (f"📦 Пакетная загрузка завершена. Файлов: {self.total}\n"
+                f"▫️ Добавлено: {self.count(self.ADDED)} (записей: {self.rows_added})\n"
+                f"▫️ Без данных: {self.count(self.EMPTY)}\n"
+                f"▫️ Дубликаты: {self.count(self.DUPLICATE)}\n"
+                f"▫️ Ошибки: {self.count(self.FAILED)}\n"
+                f"▫️ Всего загружено: {total_rows}\n\n"
+                + "\n".join(lines))
@@ -0,0 +1,53 @@
+import os
+import hashlib
+from collections import OrderedDict
+from metrics import registry
+
+# --- Настройки кэша результатов парсинга (через переменные окружения) ---
+PARSE_CACHE_ENTRIES = int(os.getenv('PARSE_CACHE_ENTRIES', 256))
+PARSE_CACHE_MB = int(os.getenv('PARSE_CACHE_MB', 128))
+
+# Признак промаха кэша: None — это закэшированный файл без данных
+MISS = object()
+
+# Доля попаданий: rate(...{result="hit"}) / rate(...) в Prometheus
+PARSE_CACHE_LOOKUPS = registry.counter(
+    'bot_parse_cache_lookups_total', "Обращения к кэшу результатов парсинга", ('result',))
+
+def content_hash(file_content: bytes) -> str:
+    """Ключ файла по содержимому: переименованная копия дает тот же ключ"""
+    return hashlib.sha256(file_content).hexdigest()
+
+class ParseCache:
+    """
+    Общий для всех пользователей LRU-кэш: хэш содержимого -> результат парсинга.
+    Файл без таблицы тоже кэшируется (как None), чтобы не разбирать его повторно;
+    ошибки чтения не кэшируются.
+    Результаты не привязаны к имени файла: колонку 'Источник' заполняет вызывающий код.
+    """
+
+    def __init__(self, max_entries: int = PARSE_CACHE_ENTRIES, max_bytes: int = PARSE_CACHE_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str):
+        if key not in self._entries:
+            PARSE_CACHE_LOOKUPS.inc('miss')
+            return MISS
+        PARSE_CACHE_LOOKUPS.inc('hit')
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: str, df):
+        size = int(df.memory_usage(index=False, deep=True).sum()) if df is not None else 0
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (df, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
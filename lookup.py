@@ -0,0 +1,90 @@
+import difflib
+import numpy as np
+import pandas as pd
+
+# Колонки, по которым ищут пользователи
+LOOKUP_COLUMNS = ('Гос_номер', 'Водитель')
+
+def normalize(value) -> str:
+    return str(value).strip().lower().replace('ё', 'е')
+
+def trigrams(value: str):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+class ColumnIndex:
+    """
+    Индекс одной колонки: нормализованное значение -> позиции строк в DataFrame сессии.
+    Поиск идет по уникальным значениям (их намного меньше, чем строк), а для подстрок
+    кандидаты сначала отбираются по триграммам.
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.display = {}
+        self._trigrams = {}
+
+    def add(self, column: pd.Series, offset: int):
+        for value, positions in column.groupby(column, observed=True).indices.items():
+            key = normalize(value)
+            if key not in self.positions:
+                self.positions[key] = []
+                self.display[key] = str(value)
+                for gram in trigrams(key):
+                    self._trigrams.setdefault(gram, set()).add(key)
+            self.positions[key].append(positions + offset)
+
+    def _substring_candidates(self, query: str):
+        grams = trigrams(query)
+        if not grams:
+            return self.positions.keys()
+        candidates = None
+        for gram in grams:
+            keys = self._trigrams.get(gram, set())
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return ()
+        return candidates
+
+    def match(self, query: str):
+        """Подходящие значения: точное совпадение, иначе по началу, иначе по подстроке"""
+        query = normalize(query)
+        if not query:
+            return []
+        if query in self.positions:
+            return [query]
+        prefix = [key for key in self.positions if key.startswith(query)]
+        if prefix:
+            return sorted(prefix)
+        return sorted(key for key in self._substring_candidates(query) if query in key)
+
+    def rows(self, keys) -> np.ndarray:
+        if not keys:
+            return np.array([], dtype=np.intp)
+        return np.sort(np.concatenate([part for key in keys for part in self.positions[key]]))
+
+    def suggest(self, query: str, limit: int = 5):
+        """Ближайшие по написанию значения — для подсказок, когда ничего не найдено"""
+        keys = difflib.get_close_matches(normalize(query), self.positions.keys(), n=limit, cutoff=0.5)
+        return [self.display[key] for key in keys]
+
+class LookupIndex:
+    """Индексы поиска по гос. номеру и фамилии водителя; обновляются при добавлении файлов"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.columns = {col: ColumnIndex() for col in LOOKUP_COLUMNS}
+
+    def add(self, chunk: pd.DataFrame, offset: int):
+        for col, index in self.columns.items():
+            index.add(chunk[col], offset)
+
+    def lookup(self, col: str, query: str):
+        """Возвращает найденные значения (в исходном написании) и позиции их строк"""
+        index = self.columns[col]
+        keys = index.match(query)
+        return [index.display[key] for key in keys], index.rows(keys)
+
+    def suggest(self, col: str, query: str, limit: int = 5):
+        return self.columns[col].suggest(query, limit)
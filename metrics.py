@@ -0,0 +1,215 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию, в секундах: от быстрых кнопок до парсинга больших файлов
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """
+    Метрика с метками в текстовом формате Prometheus.
+    Пишется из event loop и воркеров, а читается из потока HTTP-сервера, поэтому под блокировкой.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.label_names}")
+        return tuple(str(value) for value in labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{format_labels(self.label_names, key)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """
+    Значение вычисляется в момент запроса /metrics функцией callback.
+    Для метрики с метками callback возвращает словарь {(значения меток): значение}.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, callback, labels=()):
+        super().__init__(name, documentation, labels)
+        self._callback = callback
+
+    def samples(self):
+        try:
+            value = self._callback()
+        except Exception:
+            # Сломанная метрика не должна ронять весь ответ /metrics
+            logger.exception("Не удалось вычислить метрику %s", self.name)
+            return []
+        if self.label_names:
+            return [(self.name, self._key(key), item) for key, item in value.items()]
+        return [(self.name, (), value)]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(state['counts']), state['sum']) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            names = self.label_names + ('le',) if name.endswith('_bucket') else self.label_names
+            lines.append(f"{name}{format_labels(names, key)} {format_value(value)}")
+        return lines
+
+class Timer:
+    """Замер длительности блока: with HISTOGRAM.time('метка'): ..."""
+
+    def __init__(self, histogram: Histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.perf_counter() - self._start
+        self._histogram.observe(self.elapsed, *self._labels)
+        return False
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def gauge(self, name: str, documentation: str, callback, labels=()) -> Gauge:
+        return self.register(Gauge(name, documentation, callback, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Метрики процесса бота; отдаются на /metrics сервера проверки здоровья
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram(
+    'bot_handler_seconds', "Время обработки апдейта обработчиком", ('handler', 'command'))
+HANDLER_ERRORS = registry.counter(
+    'bot_handler_errors_total', "Исключения в обработчиках", ('handler', 'command'))
+DOWNLOAD_SECONDS = registry.histogram(
+    'bot_file_download_seconds', "Время скачивания файла из Telegram")
+DOWNLOAD_BYTES = registry.counter(
+    'bot_file_download_bytes_total', "Скачано байт из Telegram")
+JOB_SECONDS = registry.histogram(
+    'bot_worker_job_seconds', "Время выполнения задачи в воркере (parse, export)", ('kind',))
+JOB_WAIT_SECONDS = registry.histogram(
+    'bot_worker_wait_seconds', "Ожидание свободного воркера", ('kind',))
+JOB_FAILURES = registry.counter(
+    'bot_worker_job_failures_total', "Задачи, завершившиеся исключением или падением воркера", ('kind',))
+ROWS_PARSED = registry.counter(
+    'bot_rows_parsed_total', "Строк извлечено из загруженных файлов")
+PARSE_FAILURES = registry.counter(
+    'bot_parse_failures_total', "Файлы, из которых не удалось извлечь данные", ('reason',))
+
+# Команды, которые регистрирует бот. callback_data присылает клиент, поэтому
+# все прочие значения сводятся к одной метке и не создают новых серий
+KNOWN_COMMANDS = set()
+UNKNOWN_COMMAND = 'other'
+
+def command_label(update) -> str:
+    """Команда кнопки без параметров (номер страницы, выбранное значение), чтобы не плодить метки"""
+    query = getattr(update, 'callback_query', None)
+    if query is None or not query.data:
+        return ''
+    command = query.data.split(':')[0]
+    if command == 'pick':
+        command = ':'.join(query.data.split(':')[:2])
+    return command if command in KNOWN_COMMANDS else UNKNOWN_COMMAND
+
+def track_handler(func):
+    """Декоратор обработчика: гистограмма времени и счетчик ошибок по имени обработчика и команде"""
+    @functools.wraps(func)
+    async def wrapper(update, context):
+        labels = (func.__name__, command_label(update))
+        start = time.perf_counter()
+        try:
+            return await func(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(*labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, *labels)
+    return wrapper
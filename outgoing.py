@@ -0,0 +1,218 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# --- Лимиты исходящих сообщений (через переменные окружения) ---
+# Telegram допускает около 30 сообщений в секунду на бота, около одного в секунду
+# в личный чат (с короткими всплесками) и 20 в минуту в группу
+OUTGOING_GLOBAL_PER_SECOND = float(os.getenv('OUTGOING_GLOBAL_PER_SECOND', 30))
+OUTGOING_CHAT_PER_SECOND = float(os.getenv('OUTGOING_CHAT_PER_SECOND', 1))
+OUTGOING_CHAT_BURST = int(os.getenv('OUTGOING_CHAT_BURST', 3))
+OUTGOING_GROUP_PER_MINUTE = float(os.getenv('OUTGOING_GROUP_PER_MINUTE', 20))
+OUTGOING_MAX_RETRIES = int(os.getenv('OUTGOING_MAX_RETRIES', 3))
+# Сколько бюджетов чатов держать, прежде чем удалять простаивающие
+MAX_IDLE_CHAT_BUDGETS = 1000
+
+# Признак правки, замененной более новой правкой того же сообщения
+SUPERSEDED = object()
+
+OUTGOING_WAIT_SECONDS = registry.histogram(
+    'bot_outgoing_wait_seconds', "Ожидание бюджета перед запросом к Telegram", ('endpoint',))
+OUTGOING_RETRIES = registry.counter(
+    'bot_outgoing_retry_after_total', "Повторы запросов после RetryAfter", ('endpoint',))
+OUTGOING_COALESCED = registry.counter(
+    'bot_outgoing_coalesced_total', "Правки сообщений, замененные более новой правкой того же сообщения")
+
+class TokenBucket:
+    """
+    Бюджет запросов: rate запросов за period секунд с запасом на всплеск burst.
+    Ожидающие обслуживаются по очереди (asyncio.Lock справедлив), а после
+    RetryAfter бюджет ставится на паузу целиком.
+    """
+
+    def __init__(self, rate: float, period: float = 1.0, burst: int = 1):
+        self.interval = period / rate
+        self.capacity = max(burst, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) / self.interval)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.interval)
+
+    def refund(self):
+        """Возвращает токен запроса, который так и не был отправлен"""
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return not self._lock.locked() and self._tokens >= self.capacity and time.monotonic() >= self._paused_until
+
+class PendingEdit:
+    """Правка сообщения в очереди: ее результат и ссылки на соседние правки того же сообщения"""
+
+    def __init__(self, previous=None):
+        self.future = asyncio.get_running_loop().create_future()
+        self.previous = previous
+        self.successor = None
+
+    def newer(self):
+        """Ближайшая более новая правка, которая не отменена, или None"""
+        edit = self.successor
+        while edit is not None and edit.future.cancelled():
+            edit = edit.successor
+        return edit
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, datetime.timedelta) else float(value)
+
+class OutgoingScheduler(BaseRateLimiter):
+    """
+    Единая точка для всех исходящих запросов бота (подключается через ApplicationBuilder.rate_limiter).
+    Запросы в чат ждут бюджет своего чата и общий бюджет бота, после RetryAfter
+    чат ставится на паузу, и запрос повторяется. Если правка сообщения
+    (editMessageText) еще ждет бюджета, а для того же сообщения пришла более
+    новая, старая не отправляется: ее вызывающий получает результат новой.
+    Запросы без chat_id (ответы на кнопки, скачивание файлов) не ограничиваются.
+    """
+
+    def __init__(self, global_per_second: float = OUTGOING_GLOBAL_PER_SECOND,
+                 chat_per_second: float = OUTGOING_CHAT_PER_SECOND, chat_burst: int = OUTGOING_CHAT_BURST,
+                 group_per_minute: float = OUTGOING_GROUP_PER_MINUTE, max_retries: int = OUTGOING_MAX_RETRIES):
+        self.global_per_second = global_per_second
+        self.chat_per_second = chat_per_second
+        self.chat_burst = chat_burst
+        self.group_per_minute = group_per_minute
+        self.max_retries = max_retries
+        self._global = None
+        self._chats = {}
+        self._pending_edits = {}
+
+    async def initialize(self):
+        self._global = TokenBucket(self.global_per_second, burst=int(self.global_per_second))
+
+    async def shutdown(self):
+        self._chats.clear()
+        self._pending_edits.clear()
+
+    def _chat_budget(self, chat_id) -> TokenBucket:
+        if chat_id not in self._chats:
+            if len(self._chats) >= MAX_IDLE_CHAT_BUDGETS:
+                self._chats = {key: bucket for key, bucket in self._chats.items() if not bucket.idle}
+            # У групп и каналов отрицательные id и более строгий лимит
+            if isinstance(chat_id, int) and chat_id < 0:
+                self._chats[chat_id] = TokenBucket(self.group_per_minute, period=60, burst=self.chat_burst)
+            else:
+                self._chats[chat_id] = TokenBucket(self.chat_per_second, burst=self.chat_burst)
+        return self._chats[chat_id]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        edit_key = (chat_id, data['message_id']) if endpoint == 'editMessageText' and data.get('message_id') else None
+        if edit_key is None:
+            return await self._send(callback, args, kwargs, endpoint, chat_id)
+
+        # Правки одного сообщения связаны в цепочку от старых к новым. Ссылка на более
+        # новую правку остается и после ее завершения: старая правка может вернуться
+        # в очередь после RetryAfter, когда новая уже отправлена
+        previous = self._pending_edits.get(edit_key)
+        edit = PendingEdit(previous)
+        if previous is not None:
+            previous.successor = edit
+        self._pending_edits[edit_key] = edit
+        try:
+            result = await self._send_edit(edit, callback, args, kwargs, endpoint, chat_id)
+            edit.future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            edit.future.cancel()
+            raise
+        except Exception as e:
+            edit.future.set_exception(e)
+            # Исключение уже пробрасывается вызывающему; отметка, что оно получено
+            edit.future.exception()
+            raise
+        finally:
+            self._finish_edit(edit, edit_key)
+
+    def _finish_edit(self, edit: PendingEdit, edit_key):
+        if self._pending_edits.get(edit_key) is edit:
+            # Последняя правка отменена, не дойдя до отправки: последней становится
+            # ближайшая более старая, которая еще ждет, чтобы следующие правки заменяли ее
+            waiting = edit.previous if edit.future.cancelled() else None
+            while waiting is not None and waiting.future.cancelled():
+                waiting = waiting.previous
+            if waiting is not None and not waiting.future.done():
+                waiting.successor = None
+                self._pending_edits[edit_key] = waiting
+            else:
+                del self._pending_edits[edit_key]
+        if not edit.future.cancelled():
+            # Обрываем цепочку завершенных правок, чтобы она не росла при частых правках
+            edit.previous = None
+
+    async def _send_edit(self, edit: PendingEdit, callback, args, kwargs, endpoint, chat_id):
+        while True:
+            result = await self._send(callback, args, kwargs, endpoint, chat_id,
+                                      superseded=lambda: edit.newer() is not None)
+            if result is not SUPERSEDED:
+                return result
+            newer = edit.newer()
+            try:
+                result = await asyncio.shield(newer.future)
+                OUTGOING_COALESCED.inc()
+                return result
+            except asyncio.CancelledError:
+                # Более новая правка отменена, не дойдя до отправки: ждем следующую или отправляем эту
+                if not newer.future.cancelled():
+                    raise
+
+    async def _send(self, callback, args, kwargs, endpoint, chat_id, superseded=None):
+        chat_budget = self._chat_budget(chat_id)
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            await chat_budget.acquire()
+            if superseded is not None and superseded():
+                chat_budget.refund()
+                return SUPERSEDED
+            await self._global.acquire()
+            OUTGOING_WAIT_SECONDS.observe(time.perf_counter() - start, endpoint)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                OUTGOING_RETRIES.inc(endpoint)
+                logger.warning("RetryAfter %.0f с для %s в чате %s, повтор %d", delay, endpoint, chat_id, attempt + 1)
+                chat_budget.pause(delay)
@@ -1,99 +1,176 @@
 import pandas as pd
 import openpyxl
 import re
+import datetime
+import logging
 import io # Добавляем io для работы с файлами в памяти
 
-def find_table_structure(ws):
-    """Находит структуру таблицы по ключевым заголовкам"""
-    headers_positions = {}
-    for row in ws.iter_rows():
-        for cell in row:
-            if cell.value:
-                cell_value = str(cell.value).strip()
-                if "Товары (работы, услуги)" in cell_value:
-                    headers_positions['description'] = (cell.row, cell.column)
-                elif "Сумма" in cell_value and "Сумма с НДС" not in cell_value:
-                    headers_positions['amount'] = (cell.row, cell.column)
+logger = logging.getLogger(__name__)
+
+DESCRIPTION_HEADER = "Товары (работы, услуги)"
+AMOUNT_HEADER = "Сумма"
+# Формат даты в описании: 'от 01.03.24'
+DATE_FORMAT = '%d.%m.%y'
+
+class TableStructureNotFound(Exception):
+    """В листе не найдены заголовки описания и суммы"""
+
+class ParseError(Exception):
+    """Файл не удалось прочитать: битая или не Excel-книга"""
+
+def match_header_row(row_values, headers_positions, row_number):
+    """Ищет ключевые заголовки в одной строке и дописывает их позиции в headers_positions"""
+    for column, value in enumerate(row_values, 1):
+        if value is None:
+            continue
+        cell_value = str(value).strip()
+        if DESCRIPTION_HEADER in cell_value:
+            headers_positions['description'] = (row_number, column)
+        elif AMOUNT_HEADER in cell_value and "Сумма с НДС" not in cell_value:
+            headers_positions['amount'] = (row_number, column)
     return headers_positions
 
+# Одно предкомпилированное выражение на все поля описания. Каждое поле ищется
+# в своем lookahead от начала строки, поэтому порядок полей в тексте не важен,
+# а результат совпадает с отдельными re.search для каждого поля.
+# Номер ищется без ленивого .*? (пропуском нецифр и коротких групп цифр) —
+# это первая группа из трех цифр, как у re.search(r'\d{3}'), но заметно быстрее.
+DESCRIPTION_PATTERN = re.compile(
+    r'(?s)'
+    r'(?=(?:.*?от\s+(?P<date>\d{2}\.\d{2}\.\d{2}))?)'
+    r'(?=(?:\D*+(?:\d{1,2}+\D++)*+(?P<plate>\d{3}))?)'
+    r'(?=(?:.*?,\s*(?P<driver>[А-ЯЁ][а-яё]+)\s+[А-ЯЁ]\.[А-ЯЁ]\.)?)'
+    r'(?=(?:.*?,\s*(?P<driver_alt>[А-ЯЁ][а-яё]+))?)'
+    r'(?P<route>[^,]*)'
+)
+TOTALS_PATTERN = re.compile(r'итого|всего|сумма')
+RESULT_COLUMNS = ['Дата', 'Маршрут', 'Стоимость', 'Гос_номер', 'Водитель']
+
+def parse_date(date_str):
+    try:
+        return datetime.datetime.strptime(date_str, DATE_FORMAT) if date_str else None
+    except ValueError:
+        return None
+
 def extract_data_from_description(description):
     """Извлекает дату, маршрут, гос. номер и фамилию водителя из описания"""
-    description_str = str(description)
-    
-    route = description_str.split(',')[0].strip()
-    
-    date_match = re.search(r'от\s+(\d{2}\.\d{2}\.\d{2})', description_str)
-    date_str = date_match.group(1) if date_match else "Дата не найдена"
-    
-    plate_match = re.search(r'(\d{3})', description_str)
-    car_plate = plate_match.group(1) if plate_match else "Неизвестно"
+    match = DESCRIPTION_PATTERN.match(str(description))
     
-    driver_match = re.search(r',\s*([А-ЯЁ][а-яё]+)\s+[А-ЯЁ]\.[А-ЯЁ]\.', description_str)
-    if driver_match:
-        driver_name = driver_match.group(1)
-    else:
-        alt_driver_match = re.search(r',\s*([А-ЯЁ][а-яё]+)', description_str)
-        driver_name = alt_driver_match.group(1) if alt_driver_match else "Фамилия не найдена"
+    route = match.group('route').strip()
+    # Дата сразу приводится к настоящему типу; если ее нет или она некорректна — None
+    date = parse_date(match.group('date'))
+    car_plate = match.group('plate') or "Неизвестно"
+    driver_name = match.group('driver') or match.group('driver_alt') or "Фамилия не найдена"
     
-    return route, date_str, car_plate, driver_name
+    return route, date, car_plate, driver_name
+
+def normalize_amounts(amounts: pd.Series) -> pd.Series:
+    """Суммы в float: числа конвертируются сразу, текст вида '1 500,00' — после очистки"""
+    amount_values = pd.to_numeric(amounts, errors='coerce')
+    is_text = amount_values.isna() & amounts.notna()
+    if is_text.any():
+        amount_values[is_text] = pd.to_numeric(
+            amounts[is_text].astype(str).str.replace(' ', '', regex=False).str.replace(',', '.', regex=False),
+            errors='coerce'
+        )
+    return amount_values.astype(float)
+
+def extract_data_batch(descriptions: pd.Series, amounts: pd.Series) -> pd.DataFrame:
+    """
+    Пакетный вариант extract_data_from_description для целой колонки описаний:
+    суммы и фильтры считаются по всей колонке, а поля описания — одним
+    совпадением общего выражения на строку.
+    Нормализует суммы и отбрасывает итоговые строки, строки без гос. номера
+    и с неположительной суммой.
+    """
+    descriptions = descriptions.astype(str)
+    amount_values = normalize_amounts(amounts)
+    keep = (amount_values > 0) & ~descriptions.str.lower().str.contains(TOTALS_PATTERN)
+    descriptions, amount_values = descriptions[keep], amount_values[keep]
+
+    # Один проход выражения по колонке; Series.str.extract делает то же самое,
+    # но заметно медленнее из-за сборки результата по строкам
+    fields = pd.DataFrame.from_records(
+        [DESCRIPTION_PATTERN.match(description).groups() for description in descriptions.tolist()],
+        columns=list(DESCRIPTION_PATTERN.groupindex), index=descriptions.index
+    )
+    has_plate = fields['plate'].notna()
+    fields, amount_values = fields[has_plate], amount_values[has_plate]
+
+    result = pd.DataFrame({
+        'Дата': pd.to_datetime(fields['date'], format=DATE_FORMAT, errors='coerce'),
+        'Маршрут': fields['route'].str.strip(),
+        'Стоимость': amount_values,
+        'Гос_номер': fields['plate'],
+        'Водитель': fields['driver'].fillna(fields['driver_alt']).fillna("Фамилия не найдена"),
+    }, columns=RESULT_COLUMNS)
+    return result.reset_index(drop=True)
+
+def iter_table_rows(ws):
+    """
+    Потоково читает лист за один проход: сначала ищет заголовки,
+    затем сразу отдает пары (описание, сумма) из строк под ними.
+    """
+    headers = {}
+    description_idx = amount_idx = None
+
+    for row_number, row_values in enumerate(ws.iter_rows(values_only=True), 1):
+        if description_idx is None:
+            match_header_row(row_values, headers, row_number)
+            if 'description' in headers and 'amount' in headers:
+                description_idx = headers['description'][1] - 1
+                amount_idx = headers['amount'][1] - 1
+            continue
+
+        # В read-only режиме короткие строки не дополняются пустыми ячейками
+        if len(row_values) <= max(description_idx, amount_idx):
+            continue
+        yield row_values[description_idx], row_values[amount_idx]
+
+    if description_idx is None:
+        raise TableStructureNotFound()
 
 def process_excel_file(file_content: bytes, file_name: str):
     """
     Парсит один Excel-файл из байтового потока и возвращает DataFrame.
+    Книга открывается в read-only режиме и читается за один проход,
+    поэтому потребление памяти не зависит от размера файла.
+    Возвращает None, если в файле нет таблицы или строк с данными,
+    и выбрасывает ParseError, если файл не удалось прочитать.
     """
     try:
         # Используем io.BytesIO для чтения файла из памяти
-        wb = openpyxl.load_workbook(io.BytesIO(file_content), data_only=True)
-        ws = wb.active
-        
-        headers = find_table_structure(ws)
-        
-        if not headers.get('description') or not headers.get('amount'):
-            print(f"⚠️ В файле {file_name} не найдена структура таблицы.")
+        wb = openpyxl.load_workbook(io.BytesIO(file_content), read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            # В read-only режиме openpyxl верит размеру листа из файла (<dimension>), а другие
+            # программы часто пишут его неверно — тогда строки молча обрезаются. Читаем лист целиком
+            ws.reset_dimensions()
+            descriptions, amounts = [], []
+
+            for description, amount in iter_table_rows(ws):
+                if not description or not amount:
+                    continue
+                descriptions.append(description)
+                amounts.append(amount)
+        finally:
+            wb.close()
+
+        if not descriptions:
             return None
-        
-        header_row = max(h[0] for h in headers.values())
-        description_col = headers['description'][1]
-        amount_col = headers['amount'][1]
-        
-        parsed_data = []
-        row_num = header_row + 1
-        
-        # Проходимся по строкам до определенного предела или пока есть данные
-        for row_num in range(header_row + 1, ws.max_row + 1):
-            description = ws.cell(row=row_num, column=description_col).value
-            amount = ws.cell(row=row_num, column=amount_col).value
-
-            if not description or not amount:
-                continue
-
-            description_str = str(description)
-            if any(word in description_str.lower() for word in ['итого', 'всего', 'сумма']):
-                continue
-
-            try:
-                amount_str = str(amount).replace(' ', '').replace(',', '.')
-                amount_value = float(amount_str)
-
-                route, date_str, car_plate, driver_name = extract_data_from_description(description_str)
-                
-                if car_plate != "Неизвестно" and amount_value > 0:
-                    parsed_data.append({
-                        'Дата': date_str,
-                        'Маршрут': route,
-                        'Стоимость': amount_value,
-                        'Гос_номер': car_plate,
-                        'Водитель': driver_name,
-                        'Источник': file_name
-                    })
-            except (ValueError, TypeError):
-                continue
-        
-        if not parsed_data:
+
+        df = extract_data_batch(pd.Series(descriptions, dtype=object), pd.Series(amounts, dtype=object))
+        if df.empty:
             return None
 
-        return pd.DataFrame(parsed_data)
+        df['Источник'] = file_name
+        return df
 
-    except Exception as e:
-        print(f"❌ Ошибка при обработке файла {file_name}: {e}")
+    except TableStructureNotFound:
+        logger.warning("В файле %s не найдена структура таблицы", file_name)
         return None
+    except Exception as e:
+        logger.error("Ошибка при обработке файла %s: %s", file_name, e)
+        # Исключения openpyxl не всегда переживают передачу из процесса-воркера,
+        # поэтому наружу уходит простое исключение с текстом ошибки
+        raise ParseError(str(e) or type(e).__name__) from e
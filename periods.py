@@ -0,0 +1,191 @@
+import re
+import datetime as dt
+import pandas as pd
+
+# Разрезы, по которым ведутся итоги за периоды
+ROLLUP_COLUMNS = ('Гос_номер', 'Водитель')
+FREQUENCIES = ('day', 'week', 'month')
+
+MONTH_NAMES = ('январь', 'февраль', 'март', 'апрель', 'май', 'июнь',
+               'июль', 'август', 'сентябрь', 'октябрь', 'ноябрь', 'декабрь')
+# Сокращения месяцев; у мая сокращения нет
+MONTH_ABBREVIATIONS = {'янв': 1, 'фев': 2, 'февр': 2, 'мар': 3, 'апр': 4, 'июн': 6, 'июл': 7,
+                       'авг': 8, 'сен': 9, 'сент': 9, 'окт': 10, 'ноя': 11, 'нояб': 11, 'дек': 12}
+
+def month_forms(name: str):
+    """Именительный, родительный и предложный падежи: 'март', 'марта', 'марте'"""
+    if name[-1] in 'ьй':
+        return name, name[:-1] + 'я', name[:-1] + 'е'
+    return name, name + 'а', name + 'е'
+
+# Все слова, которые считаются названием месяца; прочие слова месяцем не являются
+MONTH_WORDS = {**{form: number for number, name in enumerate(MONTH_NAMES, 1) for form in month_forms(name)},
+               **MONTH_ABBREVIATIONS}
+
+DATE_RANGE_PATTERN = re.compile(
+    r'^(\d{1,2}\.\d{1,2}\.\d{2,4})\s*(?:-|–|—|по|\s)\s*(\d{1,2}\.\d{1,2}\.\d{2,4})$')
+SINGLE_DATE_PATTERN = re.compile(r'^\d{1,2}\.\d{1,2}\.\d{2,4}$')
+MONTH_PATTERN = re.compile(r'^([а-яё]+)(?:\s+(\d{2}|\d{4}))?$')
+
+def period_start(dates: pd.Series, freq: str) -> pd.Series:
+    """Начало дня, недели (понедельник) или месяца для каждой даты"""
+    days = dates.dt.normalize()
+    if freq == 'day':
+        return days
+    if freq == 'week':
+        return days - pd.to_timedelta(dates.dt.weekday, unit='D')
+    return days - pd.to_timedelta(dates.dt.day - 1, unit='D')
+
+def combine(current: pd.DataFrame, grouped: pd.DataFrame) -> pd.DataFrame:
+    """Складывает итоги нового файла с накопленными"""
+    if current is None:
+        return grouped.sort_index()
+    return current.add(grouped, fill_value=0).sort_index()
+
+def choose_frequency(start: dt.date, end: dt.date) -> str:
+    """Самые крупные корзины, которые покрывают период целиком"""
+    if start.day == 1 and (end + dt.timedelta(days=1)).day == 1:
+        return 'month'
+    if start.weekday() == 0 and end.weekday() == 6:
+        return 'week'
+    return 'day'
+
+class PeriodRollups:
+    """
+    Итоги по дням, неделям и месяцам — всего и в разрезе машин и водителей.
+    Пополняются при добавлении файла, поэтому статистика за период
+    собирается из нескольких корзин, а не фильтрацией всех строк.
+    Строки без даты в периоды не попадают и считаются отдельно.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # Пока файлов с датами нет, итогов нет (None)
+        self.totals = dict.fromkeys(FREQUENCIES)
+        self.tables = {freq: dict.fromkeys(ROLLUP_COLUMNS) for freq in FREQUENCIES}
+        self.undated_count = 0
+
+    def add(self, df: pd.DataFrame):
+        has_date = df['Дата'].notna()
+        self.undated_count += int((~has_date).sum())
+        dated = df[has_date]
+        if dated.empty:
+            return
+
+        for freq in FREQUENCIES:
+            start = period_start(dated['Дата'], freq).rename('period')
+            grouped = dated.groupby(start)['Стоимость'].agg(['sum', 'count'])
+            self.totals[freq] = combine(self.totals[freq], grouped)
+            for col in ROLLUP_COLUMNS:
+                grouped = dated.groupby([start, dated[col]], observed=True)['Стоимость'].agg(['sum', 'count'])
+                # Значения храним строками, чтобы складывать чанки с разными категориями
+                grouped.index = grouped.index.set_levels(grouped.index.levels[1].astype(str), level=1)
+                self.tables[freq][col] = combine(self.tables[freq][col], grouped)
+
+    @property
+    def is_empty(self) -> bool:
+        return self.totals['day'] is None
+
+    @property
+    def first_date(self):
+        return None if self.is_empty else self.totals['day'].index[0].date()
+
+    @property
+    def last_date(self):
+        return None if self.is_empty else self.totals['day'].index[-1].date()
+
+    def months(self):
+        """Месяцы, за которые есть данные, от новых к старым"""
+        return [] if self.is_empty else [period.date() for period in reversed(self.totals['month'].index)]
+
+    def summary(self, start: dt.date, end: dt.date) -> dict:
+        """Итоги за период [start, end] включительно: сумма, число маршрутов и суммы по машинам и водителям"""
+        freq = choose_frequency(start, end)
+        result = {'frequency': freq, 'amount': 0.0, 'count': 0}
+        for col in ROLLUP_COLUMNS:
+            result[col] = pd.Series(dtype=float)
+        if self.is_empty:
+            return result
+
+        # Корзины отсортированы по началу периода, поэтому нужный диапазон — срез
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        selected = self.totals[freq].loc[start:end]
+        result['amount'] = float(selected['sum'].sum())
+        result['count'] = int(selected['count'].sum())
+        for col in ROLLUP_COLUMNS:
+            part = self.tables[freq][col].loc[start:end]
+            result[col] = part['sum'].groupby(level=1).sum().sort_values(ascending=False)
+        return result
+
+def parse_date(text: str) -> dt.date:
+    day, month, year = text.split('.')
+    year = int(year) + 2000 if len(year) == 2 else int(year)
+    return dt.date(year, int(month), int(day))
+
+def month_bounds(year: int, month: int):
+    start = dt.date(year, month, 1)
+    end = (start + dt.timedelta(days=32)).replace(day=1) - dt.timedelta(days=1)
+    return start, end
+
+def month_title(start: dt.date) -> str:
+    return f"{MONTH_NAMES[start.month - 1]} {start.year}"
+
+def find_month(word: str):
+    return MONTH_WORDS.get(word)
+
+def parse_period(text: str, today: dt.date, latest: dt.date = None):
+    """
+    Период из текста пользователя или кнопки: 'эта неделя', 'прошлый месяц', 'март',
+    'март 2024', '01.03.24-15.03.24', '05.03.24'. Возвращает (начало, конец, название)
+    или None, если текст не распознан. Месяц без года — последний такой месяц
+    не позже latest (последней даты в данных), иначе не позже сегодняшнего дня.
+    """
+    text = ' '.join(text.strip().lower().replace('ё', 'е').split())
+    week_start = today - dt.timedelta(days=today.weekday())
+
+    if text == 'сегодня':
+        return today, today, "сегодня"
+    if text == 'вчера':
+        yesterday = today - dt.timedelta(days=1)
+        return yesterday, yesterday, "вчера"
+    if text in ('неделя', 'эта неделя', 'текущая неделя'):
+        return week_start, week_start + dt.timedelta(days=6), "эту неделю"
+    if text == 'прошлая неделя':
+        start = week_start - dt.timedelta(days=7)
+        return start, start + dt.timedelta(days=6), "прошлую неделю"
+    if text in ('месяц', 'этот месяц', 'текущий месяц'):
+        return (*month_bounds(today.year, today.month), "этот месяц")
+    if text == 'прошлый месяц':
+        start, _ = month_bounds(today.year, today.month)
+        previous = start - dt.timedelta(days=1)
+        return (*month_bounds(previous.year, previous.month), "прошлый месяц")
+
+    try:
+        match = DATE_RANGE_PATTERN.match(text)
+        if match:
+            start, end = parse_date(match.group(1)), parse_date(match.group(2))
+            if start > end:
+                start, end = end, start
+            return start, end, "период"
+        if SINGLE_DATE_PATTERN.match(text):
+            day = parse_date(text)
+            return day, day, "день"
+    except ValueError:
+        return None
+
+    match = MONTH_PATTERN.match(text)
+    if match:
+        month = find_month(match.group(1))
+        if month is None:
+            return None
+        if match.group(2):
+            year = int(match.group(2))
+            year = year + 2000 if year < 100 else year
+        else:
+            reference = latest or today
+            year = reference.year if month <= reference.month else reference.year - 1
+        start, end = month_bounds(year, month)
+        return start, end, month_title(start)
+    return None
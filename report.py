@@ -0,0 +1,139 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import importlib.util
+from collections import OrderedDict
+import pandas as pd
+
+# --- Настройки экспорта (через переменные окружения) ---
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'transport-bot-reports'))
+REPORT_CACHE_ENTRIES = int(os.getenv('REPORT_CACHE_ENTRIES', 200))
+
+# Parquet доступен только при установленном pyarrow
+PARQUET_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+REPORT_FORMATS = ('xlsx', 'csv', 'parquet') if PARQUET_AVAILABLE else ('xlsx', 'csv')
+
+# Строки пишутся порциями: в памяти одновременно только одна порция в виде Python-объектов
+WRITE_BATCH_ROWS = 10000
+# По скольким строкам оценивать ширину текстовых колонок
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 60
+
+def column_width(series: pd.Series) -> int:
+    """Ширина колонки по типу данных или по выборке значений, без прохода по всей колонке"""
+    header_width = len(str(series.name)) + 1
+    if pd.api.types.is_datetime64_any_dtype(series):
+        width = 10
+    elif pd.api.types.is_numeric_dtype(series):
+        width = 14
+    elif isinstance(series.dtype, pd.CategoricalDtype):
+        # Категорий обычно намного меньше, чем строк
+        width = series.cat.categories.astype(str).str.len().max() if len(series.cat.categories) else 0
+    else:
+        width = series.head(WIDTH_SAMPLE_ROWS).astype(str).str.len().max() if len(series) else 0
+    return min(max(int(width), header_width), MAX_COLUMN_WIDTH)
+
+def write_xlsx(df: pd.DataFrame, path: str):
+    # xlsxwriter нужен только при экспорте, поэтому не грузится при старте бота
+    import xlsxwriter
+    # constant_memory: строки сбрасываются на диск по мере записи, а не копятся в памяти
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Отчет')
+    header_format = workbook.add_format({'bold': True})
+    date_format = workbook.add_format({'num_format': 'DD.MM.YY'})
+    money_format = workbook.add_format({'num_format': '#,##0.00'})
+
+    writers = []
+    for idx, col in enumerate(df.columns):
+        series = df[col]
+        worksheet.set_column(idx, idx, column_width(series))
+        worksheet.write(0, idx, col, header_format)
+        if pd.api.types.is_datetime64_any_dtype(series):
+            writers.append(lambda row, idx, value: worksheet.write_datetime(row, idx, value, date_format)
+                           if not pd.isna(value) else worksheet.write_blank(row, idx, None))
+        elif pd.api.types.is_float_dtype(series):
+            writers.append(lambda row, idx, value: worksheet.write_number(row, idx, value, money_format)
+                           if value == value else worksheet.write_blank(row, idx, None))
+        else:
+            writers.append(lambda row, idx, value: worksheet.write_string(row, idx, str(value))
+                           if not pd.isna(value) else worksheet.write_blank(row, idx, None))
+
+    row = 1
+    for start in range(0, len(df), WRITE_BATCH_ROWS):
+        batch = df.iloc[start:start + WRITE_BATCH_ROWS]
+        columns = [batch[col].tolist() for col in df.columns]
+        for values in zip(*columns):
+            for idx, value in enumerate(values):
+                writers[idx](row, idx, value)
+            row += 1
+    workbook.close()
+
+def write_csv(df: pd.DataFrame, path: str):
+    # Разделитель ';', запятая в дробях и BOM — чтобы файл корректно открывался в русском Excel
+    df.to_csv(path, index=False, sep=';', decimal=',', encoding='utf-8-sig',
+              date_format='%d.%m.%Y', chunksize=WRITE_BATCH_ROWS)
+
+def write_parquet(df: pd.DataFrame, path: str):
+    df.to_parquet(path, index=False)
+
+REPORT_WRITERS = {'xlsx': write_xlsx, 'csv': write_csv, 'parquet': write_parquet}
+
+def build_report(df: pd.DataFrame, fmt: str, path: str) -> str:
+    """
+    Пишет отчет в файл нужного формата и возвращает путь к нему.
+    Функция синхронная и выполняется в пуле воркеров, а не в event loop.
+    Файл сначала пишется во временный, чтобы кэш не увидел недописанный отчет.
+    """
+    tmp_path = f"{path}.tmp"
+    REPORT_WRITERS[fmt](df, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+class ReportCache:
+    """
+    Кэш готовых отчетов по версии данных сессии: повторное нажатие экспорта
+    отдает уже собранный файл, а после первой отправки — file_id Telegram,
+    так что файл даже не загружается заново. Файлы вытесненных отчетов удаляются.
+    """
+
+    def __init__(self, directory: str = EXPORT_DIR, max_entries: int = REPORT_CACHE_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def reset(self):
+        """
+        Удаляет все файлы отчетов. Вызывается только при запуске бота, а не в конструкторе:
+        воркеры с spawn заново импортируют bot.py и иначе стирали бы отчеты работающего бота.
+        """
+        self._entries.clear()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, user_id: int, data_version: str, scope: str, fmt: str) -> str:
+        scope_hash = hashlib.sha1(scope.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(self.directory, f"{user_id}_{data_version[:16]}_{scope_hash}.{fmt}")
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry['file_id'] is None and not os.path.exists(entry['path']):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, path: str):
+        self._entries[key] = {'path': path, 'file_id': None}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            if os.path.exists(evicted['path']):
+                os.remove(evicted['path'])
+
+    def set_file_id(self, key, file_id: str):
+        if key in self._entries:
+            self._entries[key]['file_id'] = file_id
@@ -0,0 +1,182 @@
+import hashlib
+import pandas as pd
+from pandas.api.types import union_categoricals
+from lookup import LookupIndex
+from periods import PeriodRollups
+
+# Колонки, по которым ведутся накопительные итоги
+GROUP_COLUMNS = ('Гос_номер', 'Водитель', 'Источник')
+SESSION_COLUMNS = ['Дата', 'Маршрут', 'Стоимость', 'Гос_номер', 'Водитель', 'Источник']
+# Повторяющиеся строковые колонки хранятся как категории (словарное кодирование)
+CATEGORY_COLUMNS = ('Гос_номер', 'Водитель', 'Маршрут', 'Источник')
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Приводит результат парсинга к компактным типам: строковые колонки — к категориям"""
+    compact = pd.DataFrame({
+        'Дата': pd.to_datetime(df['Дата'], errors='coerce'),
+        'Маршрут': df['Маршрут'].astype('category'),
+        'Стоимость': df['Стоимость'].astype(float),
+        'Гос_номер': df['Гос_номер'].astype('category'),
+        'Водитель': df['Водитель'].astype('category'),
+        'Источник': df['Источник'].astype('category'),
+    }, columns=SESSION_COLUMNS)
+    return compact.reset_index(drop=True)
+
+def concat_compact(frames) -> pd.DataFrame:
+    """Склеивает компактные чанки, не теряя категориальных типов"""
+    if len(frames) == 1:
+        return frames[0]
+    data = {}
+    for col in SESSION_COLUMNS:
+        parts = [frame[col] for frame in frames]
+        if col in CATEGORY_COLUMNS:
+            data[col] = union_categoricals(parts)
+        else:
+            data[col] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(data, columns=SESSION_COLUMNS)
+
+def frame_memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=False, deep=True).sum())
+
+class SessionAggregates:
+    """
+    Накопительные итоги по сессии пользователя: суммы и количество маршрутов
+    в разрезе машин, водителей и файлов, а также итоги по дням, неделям и месяцам.
+    Обновляются при добавлении файла, поэтому ответы меню не требуют пересчета по всем строкам.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.total_amount = 0.0
+        self.row_count = 0
+        self.totals = {col: pd.Series(dtype=float) for col in GROUP_COLUMNS}
+        self.counts = {col: pd.Series(dtype='int64') for col in GROUP_COLUMNS}
+        self._rankings = {}
+        self.rollups = PeriodRollups()
+
+    def add(self, df: pd.DataFrame):
+        self.total_amount += float(df['Стоимость'].sum())
+        self.row_count += len(df)
+        # Итоги изменились — отсортированные рейтинги нужно пересобрать
+        self._rankings.clear()
+        for col in GROUP_COLUMNS:
+            grouped = df.groupby(col, observed=True)['Стоимость'].agg(['sum', 'count'])
+            # Индекс итогов держим обычным, чтобы складывать чанки с разными категориями
+            grouped.index = grouped.index.astype(str)
+            self.totals[col] = self.totals[col].add(grouped['sum'], fill_value=0)
+            self.counts[col] = self.counts[col].add(grouped['count'], fill_value=0).astype('int64')
+        self.rollups.add(df)
+
+    def distinct(self, col: str) -> int:
+        return len(self.totals[col])
+
+    def top(self, col: str, n: int = 5) -> pd.Series:
+        return self.totals[col].nlargest(n)
+
+    def ranking(self, col: str) -> pd.Series:
+        """Рейтинг по убыванию суммы; сортируется один раз до следующего изменения данных"""
+        if col not in self._rankings:
+            self._rankings[col] = self.totals[col].sort_values(ascending=False)
+        return self._rankings[col]
+
+    def ranking_page(self, col: str, page: int, page_size: int):
+        """Срез рейтинга для одной страницы и общее число страниц"""
+        ranking = self.ranking(col)
+        pages = max(1, -(-len(ranking) // page_size))
+        page = min(max(page, 0), pages - 1)
+        return ranking.iloc[page * page_size:(page + 1) * page_size], page, pages
+
+class UserSession:
+    """
+    Данные одного пользователя: строки, загруженные файлы и итоги по ним.
+    Каждый загруженный файл хранится отдельным компактным чанком; общий
+    DataFrame собирается лениво при первом обращении к df, поэтому
+    загрузка N файлов не копирует все предыдущие данные N раз.
+    """
+
+    def __init__(self):
+        # Загруженные файлы: хэш содержимого -> имя файла
+        self.processed_files = {}
+        self.aggregates = SessionAggregates()
+        self.index = LookupIndex()
+        self._chunks = []
+        # Объем строк каждого файла до сжатия (по хэшу) — для отчета об экономии памяти
+        self.raw_sizes = {}
+        # Объем чанков в памяти; считается при добавлении, а не обходом всех строк
+        self.compact_bytes = 0
+        # Версия данных: цепочка хэшей загруженных файлов. Одинаковые данные дают
+        # одинаковую версию и после перезапуска, поэтому по ней можно кэшировать отчеты
+        self.data_version = ''
+
+    @property
+    def is_empty(self) -> bool:
+        return self.aggregates.row_count == 0
+
+    @property
+    def row_count(self) -> int:
+        return self.aggregates.row_count
+
+    @property
+    def df(self) -> pd.DataFrame:
+        if not self._chunks:
+            return compact_frame(pd.DataFrame(columns=SESSION_COLUMNS))
+        if len(self._chunks) > 1:
+            self._chunks = [concat_compact(self._chunks)]
+            self.compact_bytes = frame_memory(self._chunks[0])
+        return self._chunks[0]
+
+    @classmethod
+    def restore(cls, df: pd.DataFrame, files):
+        """
+        Восстанавливает сессию из сохраненных компактных строк
+        и списка файлов вида (хэш, имя файла, объем до сжатия).
+        """
+        session = cls()
+        for file_hash, file_name, raw_size in files:
+            session.processed_files[file_hash] = file_name
+            session.raw_sizes[file_hash] = raw_size
+            session._bump_version(file_hash)
+        if not df.empty:
+            session._chunks.append(df)
+            session.compact_bytes = frame_memory(df)
+            session.aggregates.add(df)
+            session.index.add(df, 0)
+        return session
+
+    def append(self, new_df: pd.DataFrame, file_hash: str, file_name: str) -> pd.DataFrame:
+        """Добавляет результат парсинга файла и возвращает его компактный чанк"""
+        self.raw_sizes[file_hash] = frame_memory(new_df)
+        chunk = compact_frame(new_df)
+        self.index.add(chunk, self.row_count)
+        self._chunks.append(chunk)
+        self.compact_bytes += frame_memory(chunk)
+        self.processed_files[file_hash] = file_name
+        self.aggregates.add(chunk)
+        self._bump_version(file_hash)
+        return chunk
+
+    def _bump_version(self, file_hash: str):
+        self.data_version = hashlib.sha1((self.data_version + file_hash).encode('utf-8')).hexdigest()
+
+    def lookup(self, col: str, query: str):
+        """Строки сессии по гос. номеру или фамилии через индекс, без полного просмотра"""
+        matched, positions = self.index.lookup(col, query)
+        return matched, self.df.take(positions)
+
+    def memory_usage(self) -> dict:
+        """Объем данных сессии в памяти и объем тех же строк до сжатия"""
+        return {
+            'compact': self.compact_bytes,
+            'raw': sum(self.raw_sizes.values()),
+        }
+
+    def clear(self):
+        self._chunks = []
+        self.compact_bytes = 0
+        self.raw_sizes.clear()
+        self.processed_files.clear()
+        self.data_version = ''
+        self.aggregates.clear()
+        self.index.clear()
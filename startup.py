@@ -0,0 +1,78 @@
+"""
+Быстрый старт: порт проверки здоровья поднимается до тяжелых импортов.
+Модуль использует только стандартную библиотеку (и metrics.py на ней же),
+поэтому импортируется за миллисекунды.
+"""
+import os
+import time
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+PORT = int(os.environ.get("PORT", 8080))
+
+# Время от импорта этого модуля (начала запуска бота) до каждого этапа, в секундах
+_started = time.perf_counter()
+timings = {}
+_ready = threading.Event()
+_server = None
+
+def mark(stage: str) -> float:
+    timings[stage] = time.perf_counter() - _started
+    return timings[stage]
+
+def set_ready(ready: bool = True):
+    """Готовность (readiness) — бот принимает апдейты; живость (liveness) — процесс отвечает на порту"""
+    if ready:
+        mark('ready')
+        _ready.set()
+        logger.info("Бот готов: %s", ", ".join(f"{stage} {seconds:.2f} с" for stage, seconds in timings.items()))
+    else:
+        _ready.clear()
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+registry.gauge('bot_ready', "Бот готов принимать апдейты (1) или еще запускается (0)", lambda: int(is_ready()))
+registry.gauge('bot_startup_seconds', "Время от старта процесса до этапа запуска", lambda: {
+    (stage,): seconds for stage, seconds in timings.items()}, labels=('stage',))
+
+def health_response(path: str):
+    """(код, Content-Type, тело) для / (живость), /ready (готовность) и /metrics"""
+    if path == '/metrics':
+        return 200, "text/plain; version=0.0.4; charset=utf-8", registry.render().encode('utf-8')
+    if path == '/ready':
+        return (200, "text/plain", b"Ready") if is_ready() else (503, "text/plain", b"Starting")
+    return 200, "text/plain", b"Bot is alive"
+
+class HealthCheckHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, content_type, body = health_response(self.path.split('?')[0])
+        self.send_response(status); self.send_header("Content-type", content_type); self.end_headers(); self.wfile.write(body)
+    def do_HEAD(self):
+        status, content_type, _ = health_response(self.path.split('?')[0])
+        self.send_response(status); self.send_header("Content-type", content_type); self.end_headers()
+    def log_message(self, format, *args): return
+
+def start_health_server(port: int = PORT):
+    """Поднимает сервер проверки здоровья в отдельном потоке и сразу возвращается"""
+    global _server
+    _server = ThreadingHTTPServer(('', port), HealthCheckHandler)
+    threading.Thread(target=_server.serve_forever, daemon=True).start()
+    mark('health')
+
+def release_health_socket():
+    """
+    Останавливает поток сервера проверки здоровья и отдает его слушающий сокет
+    (режим вебхука переносит порт на asyncio-сервер без момента, когда порт закрыт).
+    Блокирует до остановки потока сервера, поэтому из корутин вызывается через asyncio.to_thread.
+    """
+    global _server
+    if _server is None:
+        return None
+    server, _server = _server, None
+    server.shutdown()
+    return server.socket
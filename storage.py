@@ -0,0 +1,217 @@
+import os
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+import pandas as pd
+from session import UserSession, SESSION_COLUMNS, CATEGORY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# --- Настройки хранилища (через переменные окружения) ---
+SESSION_BACKEND = os.getenv('SESSION_BACKEND', 'sqlite')  # sqlite | memory
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+SESSION_CACHE_ENTRIES = int(os.getenv('SESSION_CACHE_ENTRIES', 100))
+SESSION_CACHE_MB = int(os.getenv('SESSION_CACHE_MB', 512))
+
+class SessionBackend:
+    """Хранилище сессий по умолчанию: ничего не сохраняет, данные живут только в памяти"""
+
+    persistent = False
+
+    def load(self, user_id: int):
+        return None
+
+    def append(self, user_id: int, files):
+        """files: [(компактный чанк, хэш, имя файла, объем до сжатия), ...]"""
+        pass
+
+    def clear(self, user_id: int):
+        pass
+
+    def close(self):
+        pass
+
+class SQLiteBackend(SessionBackend):
+    """
+    Хранит строки и список файлов каждого пользователя в SQLite.
+    Загрузка файла дописывает только его строки, очистка удаляет строки пользователя.
+    """
+
+    persistent = True
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Запросы выполняются из потоков asyncio.to_thread, поэтому соединение общее под блокировкой
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "user_id INTEGER NOT NULL, date TEXT, route TEXT, amount REAL,"
+                "plate TEXT, driver TEXT, source TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS rows_user ON rows (user_id)")
+            # Файлы различаются по хэшу содержимого, а не по имени
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "user_id INTEGER NOT NULL, file_hash TEXT NOT NULL, file_name TEXT NOT NULL,"
+                "raw_size INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (user_id, file_hash))"
+            )
+
+    def load(self, user_id: int):
+        with self._lock:
+            files = self._conn.execute(
+                "SELECT file_hash, file_name, raw_size FROM files WHERE user_id = ? ORDER BY rowid", (user_id,)
+            ).fetchall()
+            if not files:
+                return None
+            rows = pd.read_sql_query(
+                "SELECT date, route, amount, plate, driver, source FROM rows WHERE user_id = ? ORDER BY rowid",
+                self._conn, params=(user_id,)
+            )
+
+        rows.columns = ['Дата', 'Маршрут', 'Стоимость', 'Гос_номер', 'Водитель', 'Источник']
+        rows['Дата'] = pd.to_datetime(rows['Дата'], format='%Y-%m-%d', errors='coerce')
+        for col in CATEGORY_COLUMNS:
+            rows[col] = rows[col].astype('category')
+        return UserSession.restore(rows[SESSION_COLUMNS], files)
+
+    @staticmethod
+    def _records(user_id: int, chunk: pd.DataFrame):
+        dates = chunk['Дата'].dt.strftime('%Y-%m-%d').astype(object)
+        return zip(
+            [user_id] * len(chunk),
+            dates.where(chunk['Дата'].notna(), None),
+            chunk['Маршрут'].astype(str),
+            chunk['Стоимость'].astype(float),
+            chunk['Гос_номер'].astype(str),
+            chunk['Водитель'].astype(str),
+            chunk['Источник'].astype(str),
+        )
+
+    def append(self, user_id: int, files):
+        # Все файлы пачки записываются одной транзакцией
+        with self._lock, self._conn:
+            for chunk, file_hash, file_name, raw_size in files:
+                self._conn.executemany("INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, ?)", self._records(user_id, chunk))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (user_id, file_hash, file_name, raw_size)
+                )
+
+    def clear(self, user_id: int):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM rows WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM files WHERE user_id = ?", (user_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def create_backend(name: str = SESSION_BACKEND, data_dir: str = DATA_DIR) -> SessionBackend:
+    if name == 'sqlite':
+        return SQLiteBackend(os.path.join(data_dir, 'sessions.sqlite3'))
+    if name == 'memory':
+        return SessionBackend()
+    raise ValueError(f"Неизвестный SESSION_BACKEND: {name}")
+
+class SessionStore:
+    """
+    Сессии пользователей с ограниченным LRU-кэшем в памяти.
+    Сессия подгружается из хранилища при первом обращении пользователя
+    и вытесняется, когда кэш превышает лимит по числу сессий или по объему.
+    Без постоянного хранилища вытеснение отключено, иначе данные терялись бы.
+    """
+
+    def __init__(self, backend: SessionBackend, max_entries: int = SESSION_CACHE_ENTRIES,
+                 max_bytes: int = SESSION_CACHE_MB * 1024 * 1024):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+        self._loading = {}
+        # Объем каждой сессии в памяти и их сумма: вытеснение не пересчитывает объем всех сессий
+        self._sizes = {}
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def get(self, user_id: int) -> UserSession:
+        if user_id in self._sessions:
+            self._sessions.move_to_end(user_id)
+            # Объем мог измениться при склейке чанков
+            self._track(user_id)
+            return self._sessions[user_id]
+
+        # Параллельные обращения одного пользователя ждут одну и ту же загрузку
+        if user_id not in self._loading:
+            self._loading[user_id] = asyncio.ensure_future(asyncio.to_thread(self.backend.load, user_id))
+        try:
+            session = await asyncio.shield(self._loading[user_id])
+        finally:
+            self._loading.pop(user_id, None)
+
+        if user_id not in self._sessions:
+            self._sessions[user_id] = session or UserSession()
+            self._track(user_id)
+            self._evict()
+        return self._sessions[user_id]
+
+    async def append(self, user_id: int, new_df: pd.DataFrame, file_hash: str, file_name: str) -> bool:
+        """Добавляет файл в сессию; False, если файл с таким содержимым уже загружен"""
+        accepted = await self.append_many(user_id, [(new_df, file_hash, file_name)])
+        return accepted[0]
+
+    async def append_many(self, user_id: int, files):
+        """
+        Добавляет пачку файлов [(DataFrame, хэш, имя), ...] за один шаг и одну запись в хранилище.
+        Возвращает список флагов: False для файлов, содержимое которых уже есть в сессии.
+        """
+        session = await self.get(user_id)
+        accepted, persisted = [], []
+        for new_df, file_hash, file_name in files:
+            if file_hash in session.processed_files:
+                accepted.append(False)
+                continue
+            chunk = session.append(new_df, file_hash, file_name)
+            persisted.append((chunk, file_hash, file_name, session.raw_sizes[file_hash]))
+            accepted.append(True)
+        if persisted:
+            await asyncio.to_thread(self.backend.append, user_id, persisted)
+            if self._sessions.get(user_id) is session:
+                self._track(user_id)
+            self._evict()
+        return accepted
+
+    async def clear(self, user_id: int):
+        session = await self.get(user_id)
+        session.clear()
+        self._track(user_id)
+        await asyncio.to_thread(self.backend.clear, user_id)
+
+    def memory_usage(self) -> int:
+        return self._bytes
+
+    def max_session_memory(self) -> int:
+        return max(list(self._sizes.values()), default=0)
+
+    def _track(self, user_id: int):
+        size = self._sessions[user_id].compact_bytes
+        self._bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    def _evict(self):
+        if not self.backend.persistent:
+            return
+        # Самую свежую сессию не вытесняем: ею прямо сейчас пользуются
+        while len(self._sessions) > 1 and (
+                len(self._sessions) > self.max_entries or self.memory_usage() > self.max_bytes):
+            user_id, _ = self._sessions.popitem(last=False)
+            self._bytes -= self._sizes.pop(user_id, 0)
+            logger.info("Сессия пользователя %s выгружена из памяти", user_id)
+
+    def close(self):
+        self.backend.close()
@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# Модули бота лежат в корне репозитория
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Окружение бота для тестов: без диска и без процессов, отчеты во временной папке
+os.environ.setdefault('SESSION_BACKEND', 'memory')
+os.environ.setdefault('PARSE_EXECUTOR', 'thread')
+os.environ.setdefault('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'transport-bot-tests'))
+
+@pytest.fixture(scope='session')
+def bot_services():
+    """Хранилище сессий, кэши и пул бота — один раз на весь прогон"""
+    import bot
+    bot.init_services()
+    yield
+    bot.worker_pool.shutdown()
@@ -0,0 +1,43 @@
+import io
+import asyncio
+import zipfile
+import bot
+from bulk import BatchReport
+from benchmarks.fakes import FakeDocument, FakeMessage
+from benchmarks.invoice_generator import generate_invoice
+
+def make_zip(files) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def run_batch(user_id: int, files):
+    message = FakeMessage(user_id)
+    document = FakeDocument(make_zip(files), 'batch.zip', 'application/zip')
+    asyncio.run(bot.process_batch(user_id, message, [document]))
+    return message.replies[0].text
+
+def test_broken_member_is_reported_as_failure(bot_services):
+    summary = run_batch(1, [('good.xlsx', generate_invoice(20, seed=1)), ('junk.xlsx', b'not an excel file')])
+    assert "Добавлено: 1 (записей: 20)" in summary
+    assert "Без данных: 0" in summary
+    assert "Ошибки: 1" in summary
+    assert "❌ junk.xlsx" in summary
+
+def test_failed_files_do_not_hide_rows_of_good_ones(bot_services):
+    summary = run_batch(2, [('junk.xlsx', b'junk'), ('good.xlsx', generate_invoice(10, seed=2))])
+    assert "Всего загружено: 10" in summary
+
+def test_summary_counts_each_status():
+    report = BatchReport(4)
+    report.add('a.xlsx', BatchReport.ADDED, 5)
+    report.add('b.xlsx', BatchReport.EMPTY)
+    report.add('c.xlsx', BatchReport.FAILED, 'File is not a zip file')
+    report.add('d.xlsx', BatchReport.DUPLICATE, 'a.xlsx')
+    summary = report.summary_text(5)
+    assert "Добавлено: 1 (записей: 5)" in summary
+    assert "Без данных: 1" in summary
+    assert "Ошибки: 1" in summary
+    assert "Дубликаты: 1" in summary
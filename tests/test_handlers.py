@@ -0,0 +1,63 @@
+import asyncio
+import pytest
+import bot
+from metrics import HANDLER_SECONDS, command_label
+from benchmarks.fakes import FakeUpdate, FakeContext
+from benchmarks.invoice_generator import generate_invoice
+
+USER_ID = 11
+
+@pytest.fixture(scope='module')
+def context(bot_services):
+    context = FakeContext()
+    asyncio.run(bot.handle_document(FakeUpdate.document(USER_ID, generate_invoice(300, seed=11), 'a.xlsx'), context))
+    return context
+
+def press(context, data: str) -> str:
+    update = FakeUpdate.callback(USER_ID, data)
+    asyncio.run(bot.button_handler(update, context))
+    return update.callback_query.message.text
+
+@pytest.mark.parametrize('data', ['summary_car:abc', 'summary_car:-1', 'summary_driver:', 'summary_driver:1.5'])
+def test_crafted_summary_page_shows_first_page(context, data):
+    assert "(стр. 1 из" in press(context, data)
+
+def test_summary_page_out_of_range_shows_last_page(context):
+    text = press(context, 'summary_car:999')
+    pages = text.split("из ")[1].split(")")[0]
+    assert f"(стр. {pages} из {pages})" in text
+
+def test_main_stats_lists_files(context):
+    text = press(context, 'main_stats')
+    assert "По файлам" in text
+    assert "a.xlsx: " in text
+    assert "(300 маршр.)" in text
+
+def test_file_names_are_escaped_for_markdown(bot_services):
+    context = FakeContext()
+    asyncio.run(bot.handle_document(FakeUpdate.document(12, generate_invoice(5, seed=12), 'счет_март.xlsx'), context))
+    update = FakeUpdate.callback(12, 'main_stats')
+    asyncio.run(bot.button_handler(update, context))
+    assert "счет\\_март.xlsx" in update.callback_query.message.text
+
+def handler_calls() -> dict:
+    return {key: value for name, key, value in HANDLER_SECONDS.samples() if name.endswith('_count')}
+
+@pytest.mark.parametrize('data, label', [
+    ('main_stats', 'main_stats'),
+    ('summary_car:3', 'summary_car'),
+    ('period:март 2024', 'period'),
+    ('pick:car_stats:А123АА', 'pick:car_stats'),
+    ('pick:anything:x', 'other'),
+    ('крафт-123', 'other'),
+])
+def test_command_label_is_bounded(data, label):
+    assert command_label(FakeUpdate.callback(USER_ID, data)) == label
+
+def test_back_to_main_menu_is_tracked_once(context):
+    before = handler_calls()
+    text = press(context, 'back_to_main_menu')
+    after = handler_calls()
+    assert "Аналитический бот" in text
+    changed = {key: after[key] - before.get(key, 0) for key in after if after[key] != before.get(key, 0)}
+    assert changed == {('button_handler', 'back_to_main_menu'): 1}
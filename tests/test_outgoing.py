@@ -0,0 +1,171 @@
+import time
+import asyncio
+import datetime
+import pytest
+from telegram.error import RetryAfter
+from outgoing import OutgoingScheduler, TokenBucket
+
+EDIT = {'chat_id': 1, 'message_id': 7}
+
+def run(coro):
+    return asyncio.run(coro)
+
+async def make_scheduler(**kwargs):
+    options = dict(global_per_second=1000, chat_per_second=1000, chat_burst=10, max_retries=3)
+    options.update(kwargs)
+    scheduler = OutgoingScheduler(**options)
+    await scheduler.initialize()
+    return scheduler
+
+def edit_request(scheduler, callback, text, data=EDIT):
+    return asyncio.create_task(scheduler.process_request(callback, (text,), {}, 'editMessageText', data, None))
+
+def test_bucket_allows_burst_then_rate():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+    # Два токена сразу, еще два — по 1/20 с
+    assert 0.09 <= run(scenario()) < 0.5
+
+def test_bucket_refund_and_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=1, burst=1)
+        await bucket.acquire()
+        bucket.refund()
+        start = time.monotonic()
+        await bucket.acquire()
+        refunded = time.monotonic() - start
+        bucket.refund()
+        bucket.pause(0.1)
+        start = time.monotonic()
+        await bucket.acquire()
+        return refunded, time.monotonic() - start
+    refunded, paused = run(scenario())
+    assert refunded < 0.05
+    assert 0.09 <= paused < 0.5
+
+def test_queued_edits_of_one_message_are_coalesced():
+    async def scenario():
+        scheduler = await make_scheduler()
+        sent = []
+
+        async def edit(text):
+            sent.append(text)
+            return text
+
+        # Бюджет чата на паузе: все три правки ждут, отправляется только последняя
+        scheduler._chat_budget(1).pause(0.05)
+        tasks = [edit_request(scheduler, edit, text) for text in ('A', 'B', 'C')]
+        return sent, await asyncio.gather(*tasks), scheduler._pending_edits
+
+    sent, results, pending = run(scenario())
+    assert sent == ['C']
+    assert results == ['C', 'C', 'C']
+    assert not pending
+
+def test_edit_superseded_after_retry_after_gets_newer_result():
+    # Правка A получает RetryAfter, пока правка B того же сообщения уже в очереди.
+    # B отправляется и завершается раньше, чем A снова получает бюджет
+    async def scenario():
+        scheduler = await make_scheduler()
+        sent = []
+        a_sent, release_a = asyncio.Event(), asyncio.Event()
+
+        async def edit(text):
+            sent.append(text)
+            if text == 'A':
+                a_sent.set()
+                await release_a.wait()
+                raise RetryAfter(datetime.timedelta(milliseconds=50))
+            return text
+
+        task_a = edit_request(scheduler, edit, 'A')
+        await a_sent.wait()
+        task_b = edit_request(scheduler, edit, 'B')
+        assert await task_b == 'B'
+        release_a.set()
+        return sent, await task_a, scheduler._pending_edits
+
+    sent, result, pending = run(scenario())
+    assert sent == ['A', 'B']
+    assert result == 'B'
+    assert not pending
+
+def test_edit_is_sent_when_newer_edit_is_cancelled():
+    async def scenario():
+        scheduler = await make_scheduler()
+        sent = []
+
+        async def edit(text):
+            sent.append(text)
+            return text
+
+        scheduler._chat_budget(1).pause(0.05)
+        task_a = edit_request(scheduler, edit, 'A')
+        task_b = edit_request(scheduler, edit, 'B')
+        await asyncio.sleep(0.01)
+        task_b.cancel()
+        return sent, await task_a
+
+    sent, result = run(scenario())
+    assert sent == ['A']
+    assert result == 'A'
+
+def test_edit_after_cancelled_one_still_supersedes_older():
+    async def scenario():
+        scheduler = await make_scheduler()
+        sent = []
+
+        async def edit(text):
+            sent.append(text)
+            return text
+
+        scheduler._chat_budget(1).pause(0.05)
+        task_a = edit_request(scheduler, edit, 'A')
+        task_b = edit_request(scheduler, edit, 'B')
+        await asyncio.sleep(0.01)
+        task_b.cancel()
+        await asyncio.sleep(0)
+        task_c = edit_request(scheduler, edit, 'C')
+        return sent, await asyncio.gather(task_a, task_c)
+
+    sent, results = run(scenario())
+    assert sent == ['C']
+    assert results == ['C', 'C']
+
+def test_edits_of_different_messages_are_all_sent():
+    async def scenario():
+        scheduler = await make_scheduler()
+        sent = []
+
+        async def edit(text):
+            sent.append(text)
+            return text
+
+        scheduler._chat_budget(1).pause(0.02)
+        await asyncio.gather(edit_request(scheduler, edit, 'A', {'chat_id': 1, 'message_id': 1}),
+                             edit_request(scheduler, edit, 'B', {'chat_id': 1, 'message_id': 2}))
+        return sent
+
+    assert sorted(run(scenario())) == ['A', 'B']
+
+def test_retry_after_is_retried_then_raised():
+    async def scenario(max_retries):
+        scheduler = await make_scheduler(max_retries=max_retries)
+        attempts = []
+
+        async def send(text):
+            attempts.append(text)
+            if len(attempts) < 3:
+                raise RetryAfter(datetime.timedelta(milliseconds=10))
+            return text
+
+        result = await scheduler.process_request(send, ('A',), {}, 'sendMessage', {'chat_id': 1}, None)
+        return result, len(attempts)
+
+    assert run(scenario(3)) == ('A', 3)
+    with pytest.raises(RetryAfter):
+        run(scenario(1))
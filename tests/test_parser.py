@@ -0,0 +1,105 @@
+import io
+import re
+import random
+import zipfile
+import datetime
+import openpyxl
+import pandas as pd
+import pytest
+import parser
+from benchmarks.invoice_generator import generate_invoice
+
+def with_dimension(content: bytes, ref: str) -> bytes:
+    """Копия книги с другим размером листа в <dimension>, как у файлов из сторонних программ"""
+    source = zipfile.ZipFile(io.BytesIO(content))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename.startswith('xl/worksheets/sheet'):
+                data = re.sub(rb'<dimension [^>]*/>', b'', data)
+                data = data.replace(b'<sheetData', f'<dimension ref="{ref}"/><sheetData'.encode('utf-8'), 1)
+            target.writestr(info, data)
+    return buffer.getvalue()
+
+def baseline_extract(description: str):
+    """Извлечение полей отдельными re.search, как до общего выражения"""
+    route = description.split(',')[0].strip()
+    date_match = re.search(r'от\s+(\d{2}\.\d{2}\.\d{2})', description)
+    plate_match = re.search(r'(\d{3})', description)
+    driver_match = re.search(r',\s*([А-ЯЁ][а-яё]+)\s+[А-ЯЁ]\.[А-ЯЁ]\.', description)
+    alt_driver_match = re.search(r',\s*([А-ЯЁ][а-яё]+)', description)
+    driver = (driver_match or alt_driver_match).group(1) if (driver_match or alt_driver_match) else "Фамилия не найдена"
+    return (route, parser.parse_date(date_match.group(1)) if date_match else None,
+            plate_match.group(1) if plate_match else "Неизвестно", driver)
+
+def test_reads_whole_sheet_with_stale_dimension():
+    content = with_dimension(generate_invoice(100, seed=1), 'A1:B3')
+    df = parser.process_excel_file(content, 'stale.xlsx')
+    assert df is not None
+    assert len(df) == 100
+
+def test_invoice_rows_are_extracted():
+    df = parser.process_excel_file(generate_invoice(200, seed=2), 'invoice.xlsx')
+    # Итоговые строки и строки без номера отброшены, суммы — числа
+    assert len(df) == 200
+    assert list(df.columns) == parser.RESULT_COLUMNS + ['Источник']
+    assert (df['Источник'] == 'invoice.xlsx').all()
+    assert (df['Стоимость'] > 0).all()
+    assert df['Гос_номер'].str.fullmatch(r'\d{3}').all()
+    assert df['Дата'].dropna().between('2024-03-01', '2024-03-31').all()
+
+def test_file_without_table_returns_none():
+    buffer = io.BytesIO()
+    wb = openpyxl.Workbook()
+    wb.active.append(['Просто', 'текст'])
+    wb.save(buffer)
+    assert parser.process_excel_file(buffer.getvalue(), 'empty.xlsx') is None
+
+def test_unreadable_file_raises():
+    with pytest.raises(parser.ParseError):
+        parser.process_excel_file(b'not an excel file', 'junk.xlsx')
+
+@pytest.mark.parametrize('description', [
+    'Москва - Тверь, Иванов А.Б., а/м А123ВС77 от 05.03.24',
+    'Москва - Тверь, Петров, гос. номер К456МН150, рейс от 01.03.24',
+    'Клин - Тула, Сидоров А.Б. а/м Н789ОР97',
+    'от 05.03.24 рейс 12 45 678, Семёнов В.Г.',
+    'Рейс без номера, Орлов',
+    'Маршрут без запятых 1234 от 1.3.24',
+    'Тверь, , Козлов',
+    '',
+])
+def test_combined_pattern_matches_separate_searches(description):
+    assert parser.extract_data_from_description(description) == baseline_extract(description)
+
+def test_combined_pattern_on_random_text():
+    rng = random.Random(3)
+    alphabet = 'аАбБИиоОФфЁё .,-/0123456789от'
+    for _ in range(2000):
+        description = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        assert parser.extract_data_from_description(description) == baseline_extract(description)
+
+def test_batch_matches_per_row_extraction():
+    rng = random.Random(4)
+    descriptions = [rng.choice(['Москва - Тверь, Иванов А.Б., а/м А123ВС77 от 05.03.24',
+                                'Клин - Тула, Сидоров, гос. номер Н789ОР97',
+                                'Итого по счету 123', 'Без номера, Орлов'])
+                    for _ in range(50)]
+    amounts = [rng.choice([1500.0, '1 500,00', 0, -5, 'нет']) for _ in range(50)]
+    df = parser.extract_data_batch(pd.Series(descriptions, dtype=object), pd.Series(amounts, dtype=object))
+
+    expected = []
+    for description, amount in zip(descriptions, amounts):
+        try:
+            value = float(str(amount).replace(' ', '').replace(',', '.'))
+        except ValueError:
+            continue
+        route, date, plate, driver = parser.extract_data_from_description(description)
+        if 'итого' in description.lower() or plate == "Неизвестно" or value <= 0:
+            continue
+        expected.append((route, value, plate, driver, date))
+    actual = [(row['Маршрут'], row['Стоимость'], row['Гос_номер'], row['Водитель'],
+               None if pd.isna(row['Дата']) else row['Дата'].to_pydatetime())
+              for _, row in df.iterrows()]
+    assert actual == expected
@@ -0,0 +1,120 @@
+import asyncio
+import datetime as dt
+import pandas as pd
+import pytest
+import bot
+from periods import PeriodRollups, choose_frequency, parse_period
+from benchmarks.fakes import FakeUpdate, FakeContext
+from benchmarks.invoice_generator import generate_invoice
+
+# Среда, 17.04.2024
+TODAY = dt.date(2024, 4, 17)
+
+@pytest.mark.parametrize('text, expected', [
+    ('сегодня', (dt.date(2024, 4, 17), dt.date(2024, 4, 17), "сегодня")),
+    ('Вчера', (dt.date(2024, 4, 16), dt.date(2024, 4, 16), "вчера")),
+    ('эта неделя', (dt.date(2024, 4, 15), dt.date(2024, 4, 21), "эту неделю")),
+    ('  Прошлая   неделя ', (dt.date(2024, 4, 8), dt.date(2024, 4, 14), "прошлую неделю")),
+    ('этот месяц', (dt.date(2024, 4, 1), dt.date(2024, 4, 30), "этот месяц")),
+    ('прошлый месяц', (dt.date(2024, 3, 1), dt.date(2024, 3, 31), "прошлый месяц")),
+])
+def test_relative_periods(text, expected):
+    assert parse_period(text, TODAY) == expected
+
+def test_previous_month_crosses_year():
+    assert parse_period('прошлый месяц', dt.date(2024, 1, 10))[:2] == (dt.date(2023, 12, 1), dt.date(2023, 12, 31))
+
+@pytest.mark.parametrize('text, month', [
+    ('март', 3), ('марта', 3), ('мар', 3),
+    ('май', 5), ('мая', 5), ('мае', 5),
+    ('январь', 1), ('января', 1), ('сентябрь', 9), ('сентябре', 9), ('сент', 9), ('дек', 12),
+])
+def test_month_stems(text, month):
+    start, end, _ = parse_period(f'{text} 2023', TODAY)
+    assert start == dt.date(2023, month, 1)
+    assert (end + dt.timedelta(days=1)).day == 1
+
+def test_month_title():
+    assert parse_period('февраль 2024', TODAY) == (dt.date(2024, 2, 1), dt.date(2024, 2, 29), "февраль 2024")
+
+@pytest.mark.parametrize('text', ['ма', 'мае 2024 года', 'когда-нибудь', 'неделя 2024', '',
+                                  'декада', 'сентиментально', 'мартышка', 'маяк', 'июльский'])
+def test_unknown_text(text):
+    # Слова, которые лишь начинаются как месяц ('декада', 'маяк'), месяцем не считаются
+    assert parse_period(text, TODAY) is None
+
+def test_two_digit_year():
+    assert parse_period('март 23', TODAY)[0] == dt.date(2023, 3, 1)
+
+def test_month_without_year_is_not_in_future():
+    # Май еще не наступил — берется прошлогодний
+    assert parse_period('май', TODAY)[0] == dt.date(2023, 5, 1)
+    assert parse_period('апрель', TODAY)[0] == dt.date(2024, 4, 1)
+
+def test_month_without_year_follows_latest_data():
+    latest = dt.date(2022, 8, 15)
+    assert parse_period('сентябрь', TODAY, latest)[0] == dt.date(2021, 9, 1)
+    assert parse_period('август', TODAY, latest)[0] == dt.date(2022, 8, 1)
+
+@pytest.mark.parametrize('text', ['01.03.24-15.03.24', '01.03.24 – 15.03.24', '01.03.2024 по 15.03.2024',
+                                  '01.03.24 15.03.24', '15.03.24-01.03.24'])
+def test_date_ranges(text):
+    assert parse_period(text, TODAY) == (dt.date(2024, 3, 1), dt.date(2024, 3, 15), "период")
+
+def test_single_date():
+    assert parse_period('5.3.24', TODAY) == (dt.date(2024, 3, 5), dt.date(2024, 3, 5), "день")
+
+@pytest.mark.parametrize('text', ['31.02.24', '01.13.24', '32.01.24-05.02.24', '01.01.24-00.01.24'])
+def test_invalid_dates(text):
+    assert parse_period(text, TODAY) is None
+
+@pytest.mark.parametrize('start, end, freq', [
+    (dt.date(2024, 3, 1), dt.date(2024, 3, 31), 'month'),
+    (dt.date(2024, 1, 1), dt.date(2024, 3, 31), 'month'),
+    (dt.date(2024, 2, 1), dt.date(2024, 2, 29), 'month'),
+    (dt.date(2024, 4, 15), dt.date(2024, 4, 21), 'week'),
+    (dt.date(2024, 4, 1), dt.date(2024, 4, 14), 'week'),
+    (dt.date(2024, 3, 1), dt.date(2024, 3, 30), 'day'),
+    (dt.date(2024, 4, 16), dt.date(2024, 4, 21), 'day'),
+    (dt.date(2024, 4, 17), dt.date(2024, 4, 17), 'day'),
+])
+def test_choose_frequency(start, end, freq):
+    assert choose_frequency(start, end) == freq
+
+def make_rows(dates, amounts, plates):
+    return pd.DataFrame({
+        'Дата': pd.to_datetime(dates),
+        'Стоимость': amounts,
+        'Гос_номер': plates,
+        'Водитель': ['Иванов'] * len(dates),
+    })
+
+@pytest.mark.parametrize('start, end', [
+    (dt.date(2024, 3, 1), dt.date(2024, 3, 31)),
+    (dt.date(2024, 3, 4), dt.date(2024, 3, 17)),
+    (dt.date(2024, 3, 5), dt.date(2024, 4, 2)),
+    (dt.date(2024, 2, 1), dt.date(2024, 4, 30)),
+])
+def test_summary_matches_row_filter(start, end):
+    rows = make_rows(['2024-02-28', '2024-03-01', '2024-03-04', '2024-03-17', '2024-03-31', '2024-04-02', None],
+                     [100.0, 200.0, 300.0, 400.0, 500.0, 600.0, 700.0],
+                     ['111', '222', '111', '333', '222', '111', '111'])
+    rollups = PeriodRollups()
+    # Два файла: итоги складываются
+    rollups.add(rows.iloc[:3])
+    rollups.add(rows.iloc[3:])
+
+    summary = rollups.summary(start, end)
+    selected = rows[(rows['Дата'] >= pd.Timestamp(start)) & (rows['Дата'] <= pd.Timestamp(end))]
+    assert summary['frequency'] == choose_frequency(start, end)
+    assert summary['amount'] == selected['Стоимость'].sum()
+    assert summary['count'] == len(selected)
+    assert summary['Гос_номер'].to_dict() == selected.groupby('Гос_номер')['Стоимость'].sum().to_dict()
+    assert rollups.undated_count == 1
+
+def test_crafted_period_callback_does_not_crash(bot_services):
+    context = FakeContext()
+    asyncio.run(bot.handle_document(FakeUpdate.document(7, generate_invoice(20, seed=7), 'a.xlsx'), context))
+    update = FakeUpdate.callback(7, 'period:не период')
+    asyncio.run(bot.button_handler(update, context))
+    assert update.callback_query.message.text == "❌ Не удалось распознать период."
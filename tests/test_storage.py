@@ -0,0 +1,42 @@
+import asyncio
+from storage import SQLiteBackend, SessionStore
+from benchmarks.invoice_generator import generate_invoice
+import parser
+
+def test_sessions_survive_restart(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    df = parser.process_excel_file(generate_invoice(50, seed=5), 'a.xlsx')
+
+    async def upload():
+        store = SessionStore(SQLiteBackend(path))
+        accepted = await store.append_many(1, [(df, 'hash-a', 'a.xlsx'), (df, 'hash-a', 'copy.xlsx')])
+        store.close()
+        return accepted
+
+    async def reload():
+        store = SessionStore(SQLiteBackend(path))
+        session = await store.get(1)
+        store.close()
+        return session
+
+    assert asyncio.run(upload()) == [True, False]
+    session = asyncio.run(reload())
+    assert session.processed_files == {'hash-a': 'a.xlsx'}
+    assert session.row_count == 50
+    assert session.aggregates.total_amount == df['Стоимость'].sum()
+    # Итоги за периоды восстанавливаются вместе со строками; строки без даты считаются отдельно
+    rollups = session.aggregates.rollups
+    assert rollups.summary(rollups.first_date, rollups.last_date)['count'] + rollups.undated_count == 50
+
+def test_clear_removes_rows_and_files(tmp_path):
+    path = str(tmp_path / 'sessions.sqlite3')
+    df = parser.process_excel_file(generate_invoice(10, seed=6), 'b.xlsx')
+
+    async def scenario():
+        store = SessionStore(SQLiteBackend(path))
+        await store.append(2, df, 'hash-b', 'b.xlsx')
+        await store.clear(2)
+        store.close()
+        return SQLiteBackend(path).load(2)
+
+    assert asyncio.run(scenario()) is None
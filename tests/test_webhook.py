@@ -0,0 +1,56 @@
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from webhook import BotHTTPServer
+
+UPDATE = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': 'hi'}}
+
+async def start_server(**kwargs):
+    application = SimpleNamespace(bot=None, update_queue=asyncio.Queue())
+    server = BotHTTPServer(application, path='/telegram', **kwargs)
+    await server.start(0, host='127.0.0.1')
+    port = server._server.sockets[0].getsockname()[1]
+    return server, application, port
+
+async def post(port: int, headers: dict):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = json.dumps(UPDATE).encode('utf-8')
+    head = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    writer.write(f"POST /telegram HTTP/1.1\r\nContent-Length: {len(body)}\r\nConnection: close\r\n{head}\r\n".encode('latin-1') + body)
+    status = (await reader.readline()).split()[1]
+    writer.close()
+    return int(status)
+
+def test_secret_is_checked():
+    async def scenario():
+        server, application, port = await start_server(secret='s3cret')
+        try:
+            statuses = [await post(port, {}),
+                        await post(port, {'X-Telegram-Bot-Api-Secret-Token': 'wrong'}),
+                        await post(port, {'X-Telegram-Bot-Api-Secret-Token': 's3cret'})]
+        finally:
+            await server.stop()
+        return statuses, application.update_queue.qsize()
+
+    statuses, queued = asyncio.run(scenario())
+    assert statuses == [403, 403, 200]
+    assert queued == 1
+
+def test_unfinished_request_is_closed_after_timeout():
+    async def scenario():
+        server, _, port = await start_server(read_timeout=0.1)
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            # Строка запроса без заголовков и без конца
+            writer.write(b"POST /telegram HTTP/1.1\r\nContent-")
+            start = time.monotonic()
+            data = await asyncio.wait_for(reader.read(), 2)
+            writer.close()
+            return data, time.monotonic() - start
+        finally:
+            await server.stop()
+
+    data, elapsed = asyncio.run(scenario())
+    assert data == b''
+    assert elapsed < 1
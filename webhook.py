@@ -0,0 +1,207 @@
+import os
+import hmac
+import json
+import signal
+import asyncio
+import logging
+from http import HTTPStatus
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+import startup
+
+logger = logging.getLogger(__name__)
+
+# --- Настройки приема апдейтов (через переменные окружения) ---
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # polling | webhook
+# Публичный адрес бота (https://bot.example.com); если не задан, вебхук в Telegram не регистрируется
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+# Telegram присылает его в заголовке X-Telegram-Bot-Api-Secret-Token; обязателен, если задан WEBHOOK_URL
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 256))
+# Сколько ждать очередной запрос на соединении, прежде чем закрыть его, в секундах
+WEBHOOK_READ_TIMEOUT = float(os.getenv('WEBHOOK_READ_TIMEOUT', 10))
+MAX_REQUEST_BYTES = 1024 * 1024
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Апдейты разных чатов обрабатываются параллельно, а апдейты одного чата — строго
+    по очереди, в порядке поступления. Иначе, например, ввод номера мог бы обогнать
+    нажатие кнопки, открывшей диалог. Апдейт, ждущий свой чат, занимает слот
+    max_concurrent_updates, поэтому лимит стоит держать с запасом: тяжелую работу
+    все равно ограничивает пул воркеров.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}
+
+    @staticmethod
+    def chat_key(update):
+        if isinstance(update, Update):
+            if update.effective_chat:
+                return update.effective_chat.id
+            if update.effective_user:
+                return ('user', update.effective_user.id)
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.chat_key(update)
+        if key is None:
+            await coroutine
+            return
+        # Блокировка живет, пока у чата есть апдейты в работе или в ожидании
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+class BotHTTPServer:
+    """
+    Один asyncio HTTP-сервер на PORT: прием апдейтов Telegram (POST на WEBHOOK_PATH),
+    проверка здоровья (GET / и /ready) и метрики (GET /metrics).
+    Апдейт ставится в очередь приложения, и Telegram сразу получает ответ 200,
+    не дожидаясь обработки. Локально можно проверить, отправив POST-запросом
+    записанный JSON апдейта (см. benchmarks/post_updates.py).
+    """
+
+    def __init__(self, application=None, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 read_timeout: float = WEBHOOK_READ_TIMEOUT):
+        self.application = application
+        self.path = path
+        self.secret = secret
+        self.read_timeout = read_timeout
+        self._server = None
+
+    async def start(self, port: int, host: str = '0.0.0.0', sock=None):
+        """sock — уже слушающий сокет (порт проверки здоровья, поднятый при старте)"""
+        if sock is not None:
+            self._server = await asyncio.start_server(self._handle_connection, sock=sock)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info("HTTP-сервер слушает порт %d", port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            # Telegram держит соединение открытым и шлет апдейты по одному и тому же сокету
+            while True:
+                # Клиент, который не дослал запрос, не должен держать соединение вечно
+                request = await asyncio.wait_for(self._read_request(reader), self.read_timeout)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, content_type, payload = await self.handle(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'HEAD':
+                    payload = b''
+                status = HTTPStatus(status)
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1')
+                    + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_REQUEST_BYTES:
+            raise ValueError("Слишком большой запрос")
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?')[0], headers, body
+
+    async def handle(self, method: str, path: str, headers: dict, body: bytes):
+        """Возвращает (статус, Content-Type, тело ответа)"""
+        if path == self.path and self.application is not None:
+            if method != 'POST':
+                return HTTPStatus.METHOD_NOT_ALLOWED, 'text/plain', b''
+            if self.secret and not hmac.compare_digest(
+                    headers.get('x-telegram-bot-api-secret-token', '').encode('latin-1'), self.secret.encode('latin-1')):
+                return HTTPStatus.FORBIDDEN, 'text/plain', b''
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+            except Exception:
+                logger.warning("Не удалось разобрать апдейт из вебхука", exc_info=True)
+                return HTTPStatus.BAD_REQUEST, 'text/plain', b''
+            await self.application.update_queue.put(update)
+            return HTTPStatus.OK, 'text/plain', b''
+        if method not in ('GET', 'HEAD'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, 'text/plain', b''
+        return startup.health_response(path)
+
+async def run_webhook(application, port: int):
+    """
+    Запуск бота в режиме вебхука вместо опроса Telegram и отдельного потока проверки здоровья.
+    Повторяет жизненный цикл Application.run_polling: post_init, start, stop, shutdown, post_shutdown.
+    """
+    # Без секрета любой, кто достучится до порта, может прислать поддельный апдейт от имени любого чата
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise ValueError("Для вебхука с WEBHOOK_URL необходимо установить переменную окружения WEBHOOK_SECRET")
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET не задан: апдейты на %s принимаются без проверки", WEBHOOK_PATH)
+    server = BotHTTPServer(application)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    # Порт поднимаем до инициализации приложения, чтобы проверка здоровья проходила сразу.
+    # Если он уже поднят при старте, забираем его сокет у потока проверки здоровья
+    # (shutdown сервера ждет до полсекунды, поэтому не в event loop)
+    await server.start(port, sock=await asyncio.to_thread(startup.release_health_socket))
+    try:
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None,
+                allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        logger.info("Бот принимает апдейты через вебхук на %s", WEBHOOK_PATH)
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import functools
+import logging
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from report import build_report
+from metrics import JOB_SECONDS, JOB_WAIT_SECONDS, JOB_FAILURES
+
+logger = logging.getLogger(__name__)
+
+# --- Настройки пула (через переменные окружения) ---
+PARSE_EXECUTOR = os.getenv('PARSE_EXECUTOR', 'process')   # process | thread
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+EXPORT_EXECUTOR = os.getenv('EXPORT_EXECUTOR', 'thread')  # process | thread
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', 32))
+MAX_JOBS_PER_USER = int(os.getenv('MAX_JOBS_PER_USER', 2))
+# Задачи дольше этого порога пишутся в лог с именем файла
+SLOW_JOB_SECONDS = float(os.getenv('SLOW_JOB_SECONDS', 10))
+
+def timed_call(func, *args):
+    """Выполняется в воркере: возвращает результат и чистое время работы без ожидания в очереди"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def process_excel_file(file_content: bytes, file_name: str):
+    # parser (и openpyxl) импортируется только в воркере: процесс бота его не загружает
+    from parser import process_excel_file
+    return process_excel_file(file_content, file_name)
+
+class PoolBusyError(Exception):
+    """Общая очередь задач заполнена"""
+
+class UserBusyError(Exception):
+    """У пользователя уже выполняется максимум задач"""
+
+class WorkerPool:
+    """
+    Выполняет тяжелые синхронные задачи (парсинг, экспорт) вне event loop.
+    Очередь ограничена: задачи сверх лимита отклоняются сразу, а не копятся.
+    Все счетчики меняются только из event loop, поэтому блокировки не нужны.
+    """
+
+    def __init__(self, parse_executor=PARSE_EXECUTOR, parse_workers=PARSE_WORKERS,
+                 export_executor=EXPORT_EXECUTOR, export_workers=EXPORT_WORKERS,
+                 max_queued_jobs=MAX_QUEUED_JOBS, max_jobs_per_user=MAX_JOBS_PER_USER):
+        self._config = {
+            'parse': (parse_executor, parse_workers),
+            'export': (export_executor, export_workers),
+        }
+        self._executors = {}
+        self.max_queued_jobs = max_queued_jobs
+        self.max_jobs_per_user = max_jobs_per_user
+        self.queued_jobs = 0
+        self._user_jobs = defaultdict(int)
+
+    def _get_executor(self, kind):
+        # Пулы создаются лениво, чтобы не поднимать процессы до первой задачи
+        if kind not in self._executors:
+            executor_type, workers = self._config[kind]
+            if executor_type == 'process':
+                # spawn вместо fork: в процессе бота уже работают потоки
+                self._executors[kind] = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executors[kind] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=kind)
+            logger.info("Пул '%s' запущен: %s x%d", kind, executor_type, workers)
+        return self._executors[kind]
+
+    def _admit(self, user_id):
+        if self.queued_jobs >= self.max_queued_jobs:
+            raise PoolBusyError()
+        if self._user_jobs[user_id] >= self.max_jobs_per_user:
+            raise UserBusyError()
+        self._user_jobs[user_id] += 1
+
+    def _release(self, user_id):
+        self._user_jobs[user_id] -= 1
+        if not self._user_jobs[user_id]:
+            del self._user_jobs[user_id]
+
+    async def _execute(self, kind, func, *args, label: str = None):
+        self.queued_jobs += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, elapsed = await loop.run_in_executor(
+                self._get_executor(kind), functools.partial(timed_call, func, *args))
+            JOB_SECONDS.observe(elapsed, kind)
+            JOB_WAIT_SECONDS.observe(max(time.perf_counter() - start - elapsed, 0), kind)
+            if elapsed >= SLOW_JOB_SECONDS:
+                logger.warning("Медленная задача '%s' (%s): %.1f с", kind, label, elapsed)
+            return result
+        except BrokenProcessPool:
+            # Воркер упал (например, по памяти) — пересоздадим пул при следующей задаче
+            logger.error("Пул '%s' сломан, будет пересоздан", kind)
+            JOB_FAILURES.inc(kind)
+            self._executors.pop(kind, None)
+            raise
+        except Exception:
+            JOB_FAILURES.inc(kind)
+            raise
+        finally:
+            self.queued_jobs -= 1
+
+    async def run(self, kind, user_id, func, *args, label: str = None):
+        self._admit(user_id)
+        try:
+            return await self._execute(kind, func, *args, label=label)
+        finally:
+            self._release(user_id)
+
+    async def parse(self, user_id, file_content: bytes, file_name: str):
+        return await self.run('parse', user_id, process_excel_file, file_content, file_name, label=file_name)
+
+    async def parse_many(self, user_id, files, on_done=None):
+        """
+        Параллельно парсит пачку файлов [(содержимое, имя), ...] как одну задачу пользователя.
+        В очереди одновременно не больше файлов пачки, чем воркеров парсинга, поэтому
+        большая пачка не вытесняет задачи других пользователей. Результаты возвращаются
+        в порядке входа; исключения отдельных файлов возвращаются вместо результата.
+        """
+        self._admit(user_id)
+        try:
+            limit = asyncio.Semaphore(self._config['parse'][1])
+
+            async def parse_one(file_content, file_name):
+                async with limit:
+                    try:
+                        result = await self._execute('parse', process_excel_file, file_content, file_name, label=file_name)
+                    except Exception as e:
+                        result = e
+                if on_done:
+                    await on_done(file_name, result)
+                return result
+
+            return await asyncio.gather(*(parse_one(content, name) for content, name in files))
+        finally:
+            self._release(user_id)
+
+    async def export(self, user_id, df, fmt: str, path: str):
+        return await self.run('export', user_id, build_report, df, fmt, path, label=os.path.basename(path))
+
+    def shutdown(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()